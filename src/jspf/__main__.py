@@ -0,0 +1,26 @@
+from jspf.compiler import explain
+from jspf.compiler.CompilerError import CompilerError
+import argparse
+import sys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='jspf',
+        description='JSON Structure Preserving Filtering')
+    parser.add_argument('--explain',
+                        metavar='FILTER',
+                        required=True,
+                        help='print how FILTER is compiled')
+    args = parser.parse_args(argv)
+
+    try:
+        report = explain.explain(args.explain)
+    except CompilerError as e:
+        print('jspf: {}'.format(e), file=sys.stderr)
+        return 2
+
+    print(explain.format_report(report))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+from jspf import backend
+from jspf import stream
+import asyncio
+
+'''
+asyncio counterparts of the jspf.stream readers.
+
+The stream is only read when the consumer asks for the next document, so a
+slow consumer applies backpressure to the connection. Splitting costs one scan
+of each chunk; parsing can be moved off the event loop with an executor.
+'''
+
+async def aiter_spans(reader, unwrap=False, chunk_size=stream.CHUNK_SIZE):
+    '''
+    Yield (offset, document) pairs from the asyncio.StreamReader reader.
+    '''
+    splitter = stream.Splitter(unwrap)
+    while True:
+        data = await reader.read(chunk_size)
+        if len(data) == 0:
+            break
+        for span in splitter.feed(data):
+            yield span
+    for span in splitter.close():
+        yield span
+
+def loads_all(json_backend, docs):
+    return list(map(json_backend.loads, docs))
+
+async def aiter_documents(reader,
+                          unwrap=False,
+                          json_backend=None,
+                          executor=None,
+                          chunk_size=stream.CHUNK_SIZE):
+    '''
+    Yield the parsed documents of the asyncio.StreamReader reader.
+
+    If executor is given, the documents completed by each chunk are parsed in
+    the executor instead of on the event loop.
+    '''
+    if json_backend is None:
+        json_backend = backend.select_backend()
+    loop = asyncio.get_event_loop()
+    splitter = stream.Splitter(unwrap)
+    eof = False
+    while not eof:
+        data = await reader.read(chunk_size)
+        if len(data) == 0:
+            eof = True
+            spans = splitter.close()
+        else:
+            spans = splitter.feed(data)
+        if len(spans) == 0:
+            continue
+
+        docs = [doc for (_, doc) in spans]
+        if executor is None:
+            parsed = loads_all(json_backend, docs)
+        else:
+            parsed = await loop.run_in_executor(executor,
+                                                loads_all,
+                                                json_backend,
+                                                docs)
+        for doc in parsed:
+            yield doc
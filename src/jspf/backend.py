@@ -0,0 +1,95 @@
+'''
+Document parsing backends.
+
+Every backend exposes the same `loads` which accepts a JSON document as `str`
+or UTF-8 `bytes` and returns the usual python objects (dict, list, str, int,
+float, bool, None). Backends, including the stdlib json module, are only
+imported once they are selected.
+
+The stdlib json module is always available and is the default. orjson,
+simdjson and ujson are faster but have to be selected explicitly, since they
+do not parse every document like json does: orjson turns integers beyond 64
+bits into floats, and it rejects NaN, Infinity, -Infinity, lone surrogates
+and numbers beyond the range of a float, all of which json accepts.
+'''
+
+class Backend:
+    def __init__(self, name, loads):
+        super().__init__()
+        self.name = name
+        self.loads = loads
+
+    def __repr__(self):
+        return str(self.to_dict())
+
+    def to_dict(self):
+        return {'backend': self.name}
+
+def load_json():
+    import json
+    return Backend('json', json.loads)
+
+def load_orjson():
+    import orjson
+    return Backend('orjson', orjson.loads)
+
+def load_simdjson():
+    import simdjson
+    return Backend('simdjson', simdjson.loads)
+
+def load_ujson():
+    import ujson
+    return Backend('ujson', ujson.loads)
+
+LOADERS = {
+    'orjson': load_orjson,
+    'simdjson': load_simdjson,
+    'ujson': load_ujson,
+    'json': load_json,
+}
+
+DEFAULT = 'json'
+
+# Fastest first; json is the fallback which always exists.
+PREFERENCE = ['orjson', 'simdjson', 'ujson', 'json']
+
+def get_backend(name):
+    '''
+    Load the backend called name, raising ImportError if it is not installed
+    and ValueError if it is not a known backend.
+    '''
+    loader_f = LOADERS.get(name, None)
+    if loader_f is None:
+        raise ValueError('Unknown JSON backend "{}", expected one of {}'.format(
+            name,
+            ', '.join(PREFERENCE)))
+    return loader_f()
+
+def available_backends():
+    backends = list()
+    for name in PREFERENCE:
+        try:
+            backends.append(get_backend(name))
+        except ImportError:
+            pass
+    return backends
+
+def select_backend(name=None):
+    '''
+    Select the backend called name, or the stdlib json backend if name is
+    None.
+    '''
+    if name is None:
+        name = DEFAULT
+    return get_backend(name)
+
+def fastest_backend():
+    '''
+    Select the fastest installed backend, accepting its differences from the
+    stdlib json module.
+    '''
+    for name in PREFERENCE:
+        try:
+            return get_backend(name)
+        except ImportError:
+            pass
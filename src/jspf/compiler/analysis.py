@@ -0,0 +1,67 @@
+from jspf.compiler import lexer
+from jspf.compiler import syntax
+import re
+
+'''
+Static analysis of parse trees.
+'''
+
+ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+# Quantifiers which still require at least one occurrence.
+EXIST_QUANTIFIERS = {lexer.TokenType.DEFAULT_EXIST,
+                     lexer.TokenType.GREEDY_EXIST,
+                     lexer.TokenType.LAZY_EXIST}
+
+def str_match_text(lexeme):
+    '''
+    Return the string matched by the STR_MATCH lexeme, e.g. "foo" for "[foo]"
+    and "a]b" for "[a\\]b]".
+    '''
+    return ESCAPE_RE.sub(r'\1', lexeme[1:-1])
+
+def sequence(tree):
+    '''
+    Yield the (A, Q) subtrees of the S or E tree in order.
+    '''
+    while len(tree.subtree) > 0:
+        (a_tree, q_tree, tree) = tree.subtree
+        yield (a_tree, q_tree)
+
+def alternatives(s_tree, u_tree):
+    '''
+    Return the S subtrees of the alternatives of a bracket "(SU)".
+    '''
+    return [s_tree] + u_tree.subtree[1::2]
+
+def is_required(q_tree):
+    return len(q_tree.subtree) == 0 or \
+        q_tree.subtree[0].token_type in EXIST_QUANTIFIERS
+
+def required_keys(tree):
+    '''
+    Return the set of object keys that must be navigated into by every match
+    of the S tree, i.e. the "[foo]" steps which are not optional, not in a
+    negative look ahead and are shared by all alternatives of a union.
+
+    A document which does not contain all of these keys cannot match.
+    '''
+    keys = set()
+    for (a_tree, q_tree) in sequence(tree):
+        if not is_required(q_tree):
+            continue
+
+        first = a_tree.subtree[0]
+        if isinstance(first, syntax.Tree):
+            (t_tree, c_tree) = a_tree.subtree
+            if t_tree.subtree[0].token_type == lexer.TokenType.NAV and \
+                    len(c_tree.subtree) == 1 and \
+                    c_tree.subtree[0].token_type == lexer.TokenType.STR_MATCH:
+                keys.add(str_match_text(c_tree.subtree[0].lexeme))
+
+        elif first.token_type != lexer.TokenType.NONCAP_NEG_BEGIN:
+            (_, s_tree, u_tree, _) = a_tree.subtree
+            alt_keys = list(map(required_keys, alternatives(s_tree, u_tree)))
+            keys.update(set.intersection(*alt_keys))
+
+    return keys
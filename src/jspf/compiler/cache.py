@@ -0,0 +1,528 @@
+from jspf.compiler import lexer
+from jspf.compiler import syntax
+from jspf.compiler.CompilerError import CompilerError
+import mmap
+import os
+import struct
+import threading
+
+'''
+Binary format of a table of compiled filters, and of the journal of a
+FilterCache:
+
+TABLE   --> HEADER FILTER{n_filters} OFFSET{n_nodes} NODE{n_nodes} LEXEMES
+HEADER  --> MAGIC VERSION n_filters n_nodes nodes_size lexemes_size
+FILTER  --> DIGEST root
+NODE    --> TREE_TAG node_type n_subtree child{n_subtree}
+NODE    --> TOKEN_TAG token_type lexeme_offset lexeme_size
+JOURNAL --> (table_size TABLE){n_records}
+
+All integers are little endian. Identical subtrees, within a filter and
+across filters, are stored once as by syntax.Interner: a node is referred to
+by its index, OFFSET is the position of each NODE record after the first one,
+and the children of a tree always come before it. LEXEMES holds the UTF-8
+lexemes of all tokens. FILTER records are sorted by DIGEST, the sha256 of the
+filter source, and root is the node of its parse tree.
+
+Like the trees of syntax.Interner, loaded trees share identical subtrees and
+their tokens carry no position. Nodes are decoded once per table, either
+lazily when a filter using them is loaded or all at once by decode_all.
+
+FORMAT_VERSION must be bumped whenever the lexer, the grammar or this layout
+changes so stale cache entries are never loaded.
+'''
+
+MAGIC = b'JSPF'
+FORMAT_VERSION = 4
+
+HEADER = struct.Struct('<4sH2xIIII')
+FILTER_RECORD = struct.Struct('<32sI')
+OFFSET = struct.Struct('<I')
+TREE_RECORD = struct.Struct('<BBxxI')
+CHILD = struct.Struct('<I')
+TOKEN_RECORD = struct.Struct('<BBxxII')
+JOURNAL_RECORD = struct.Struct('<I')
+
+TREE_TAG = 0
+TOKEN_TAG = 1
+
+# compile_many decodes the whole table at once when it looks up at least one
+# filter in this many.
+BULK_DECODE_RATIO = 4
+
+# The journal of a FilterCache is compacted into its table once it holds more
+# filters than both this and the table.
+COMPACT_MIN_FILTERS = 256
+
+NODE_TYPES = {node_type.value: node_type for node_type in syntax.Node}
+TOKEN_TYPES = {token_type.value: token_type for token_type in lexer.TokenType}
+
+def digest(prog):
+    import hashlib
+    return hashlib.sha256(prog.encode('utf-8')).digest()
+
+def encode(entries):
+    '''
+    Serialise the (digest, tree) pairs of entries into one table.
+    '''
+    # The index of the record of each distinct node, and of each node object
+    # already seen, so subtrees shared as by syntax.Interner are walked once.
+    # Nodes are keyed by the value of their type, which hashes faster than the
+    # enum, and by a tuple of children or a lexeme, which never compare equal.
+    index = dict()
+    seen = dict()
+    records = list()
+    lexemes = list()
+    lexemes_size = 0
+    filters = dict()
+    for (prog_digest, tree) in entries:
+        # Iterative post order, so children are numbered before their parents
+        # and deep trees do not hit the recursion limit.
+        stack = [(tree, False)]
+        indices = list()
+        while len(stack) > 0:
+            (node, visited) = stack.pop()
+            if id(node) in seen:
+                indices.append(seen[id(node)])
+                continue
+            if isinstance(node, syntax.Tree) and not visited:
+                stack.append((node, True))
+                stack.extend((st, False) for st in reversed(node.subtree))
+                continue
+
+            if isinstance(node, syntax.Tree):
+                n_subtree = len(node.subtree)
+                children = tuple(indices[len(indices)-n_subtree:])
+                del indices[len(indices)-n_subtree:]
+                key = (node.node_type.value, children)
+            else:
+                key = (node.token_type.value, node.lexeme)
+            if key not in index:
+                if isinstance(node, syntax.Tree):
+                    record = TREE_RECORD.pack(TREE_TAG, key[0], n_subtree)
+                    record += struct.pack('<{}I'.format(n_subtree), *children)
+                else:
+                    lexeme = node.lexeme.encode('utf-8')
+                    record = TOKEN_RECORD.pack(TOKEN_TAG,
+                                               key[0],
+                                               lexemes_size,
+                                               len(lexeme))
+                    lexemes.append(lexeme)
+                    lexemes_size += len(lexeme)
+                index[key] = len(records)
+                records.append(record)
+            seen[id(node)] = index[key]
+            indices.append(index[key])
+        filters[prog_digest] = indices[0]
+
+    offsets = list()
+    nodes_size = 0
+    for record in records:
+        offsets.append(OFFSET.pack(nodes_size))
+        nodes_size += len(record)
+
+    chunks = [HEADER.pack(MAGIC,
+                          FORMAT_VERSION,
+                          len(filters),
+                          len(records),
+                          nodes_size,
+                          lexemes_size)]
+    chunks.extend(FILTER_RECORD.pack(prog_digest, root)
+                  for (prog_digest, root) in sorted(filters.items()))
+    chunks.extend(offsets)
+    chunks.extend(records)
+    chunks.extend(lexemes)
+    return b''.join(chunks)
+
+def dumps_many(compiled):
+    '''
+    Serialise the (prog, tree) pairs of compiled into one table.
+    '''
+    return encode([(digest(prog), tree) for (prog, tree) in compiled])
+
+def dumps(tree, prog):
+    return dumps_many([(prog, tree)])
+
+class Table:
+    '''
+    The compiled filters of the table in data, which may be any buffer such
+    as bytes or an mmap. Raises ValueError if data is not a table of this
+    FORMAT_VERSION.
+    '''
+    def __init__(self, data):
+        super().__init__()
+        if len(data) < HEADER.size:
+            raise ValueError('Truncated compiled filter')
+        (magic, version, n_filters, n_nodes, nodes_size, lexemes_size) = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Unsupported compiled filter format')
+
+        self.filters_offset = HEADER.size
+        self.offsets_offset = self.filters_offset + n_filters*FILTER_RECORD.size
+        self.nodes_offset = self.offsets_offset + n_nodes*OFFSET.size
+        self.lexemes_offset = self.nodes_offset + nodes_size
+        if self.lexemes_offset + lexemes_size != len(data):
+            raise ValueError('Truncated compiled filter')
+
+        self.data = data
+        self.n_filters = n_filters
+        self.n_nodes = n_nodes
+        self.nodes_size = nodes_size
+        self.lexemes_size = lexemes_size
+        self.nodes = [None] * n_nodes
+        self.children_structs = dict()
+
+    def digest_at(self, idx):
+        offset = self.filters_offset + idx*FILTER_RECORD.size
+        return bytes(self.data[offset:offset+32])
+
+    def find(self, prog_digest):
+        '''
+        Return the root node of the filter with the digest, or None.
+        '''
+        (lo, hi) = (0, self.n_filters)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.digest_at(mid) < prog_digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n_filters or self.digest_at(lo) != prog_digest:
+            return None
+        return FILTER_RECORD.unpack_from(
+            self.data, self.filters_offset + lo*FILTER_RECORD.size)[1]
+
+    def roots(self):
+        return [FILTER_RECORD.unpack_from(
+                    self.data, self.filters_offset + idx*FILTER_RECORD.size)
+                for idx in range(self.n_filters)]
+
+    def children(self, n_subtree):
+        if n_subtree not in self.children_structs:
+            self.children_structs[n_subtree] = \
+                struct.Struct('<{}I'.format(n_subtree))
+        return self.children_structs[n_subtree]
+
+    def decode_node(self, idx):
+        '''
+        Decode node idx, whose children must be decoded already, or return the
+        indices of its children which are not.
+        '''
+        data = self.data
+        nodes = self.nodes
+        (offset,) = OFFSET.unpack_from(data, self.offsets_offset + idx*OFFSET.size)
+        if offset >= self.nodes_size:
+            raise ValueError('Malformed compiled filter')
+        offset += self.nodes_offset
+        tag = data[offset]
+        if tag == TREE_TAG:
+            (_, node_type, n_subtree) = TREE_RECORD.unpack_from(data, offset)
+            offset += TREE_RECORD.size
+            if offset + n_subtree*CHILD.size > self.lexemes_offset:
+                raise ValueError('Malformed compiled filter')
+            children = self.children(n_subtree).unpack_from(data, offset)
+            if n_subtree > 0 and max(children) >= idx:
+                raise ValueError('Malformed compiled filter')
+            subtree = [nodes[child] for child in children]
+            if None in subtree:
+                return [child for child in children if nodes[child] is None]
+            node = syntax.Tree(NODE_TYPES[node_type])
+            node.subtree = subtree
+
+        elif tag == TOKEN_TAG:
+            (_, token_type, lexeme_offset, lexeme_size) = \
+                TOKEN_RECORD.unpack_from(data, offset)
+            if lexeme_offset + lexeme_size > self.lexemes_size:
+                raise ValueError('Malformed compiled filter')
+            lexeme_offset += self.lexemes_offset
+            lexeme = str(data[lexeme_offset:lexeme_offset+lexeme_size], 'utf-8')
+            node = lexer.Token(None, TOKEN_TYPES[token_type], lexeme, None)
+
+        else:
+            raise ValueError('Unknown record tag {}'.format(tag))
+        nodes[idx] = node
+        return None
+
+    def decode(self, idx):
+        '''
+        Return node idx, decoding it and every node below it not decoded yet.
+        '''
+        nodes = self.nodes
+        stack = [idx]
+        try:
+            while len(stack) > 0:
+                if nodes[stack[-1]] is not None:
+                    stack.pop()
+                    continue
+                missing = self.decode_node(stack[-1])
+                if missing is None:
+                    stack.pop()
+                else:
+                    stack.extend(missing)
+        except (IndexError, KeyError, struct.error, UnicodeDecodeError):
+            raise ValueError('Malformed compiled filter')
+        return nodes[idx]
+
+    def decode_all(self):
+        '''
+        Decode every node at once, cheaper than one filter at a time when
+        most of the table is needed.
+        '''
+        nodes = self.nodes
+        try:
+            for idx in range(self.n_nodes):
+                if nodes[idx] is None and self.decode_node(idx) is not None:
+                    raise ValueError('Malformed compiled filter')
+        except (IndexError, KeyError, struct.error, UnicodeDecodeError):
+            raise ValueError('Malformed compiled filter')
+
+    def load(self, prog):
+        '''
+        Return the parse tree of prog, or None if prog is not in the table.
+        '''
+        root = self.find(digest(prog))
+        if root is None:
+            return None
+        tree = self.decode(root)
+        if not isinstance(tree, syntax.Tree):
+            raise ValueError('Malformed compiled filter')
+        return tree
+
+def loads(data, prog):
+    '''
+    Return the parse tree of prog from the table in data. Raises ValueError if
+    data is not a compiled form of prog for this FORMAT_VERSION.
+    '''
+    tree = Table(data).load(prog)
+    if tree is None:
+        raise ValueError('Compiled filter does not belong to the source')
+    return tree
+
+class FilterCache:
+    '''
+    An on-disk cache of compiled filters, kept in one table per FORMAT_VERSION
+    which is mapped into memory once. Filters stored since the table was
+    written are appended to a journal, so storing costs time in proportion to
+    the stored filters alone, and the journal is merged into a new table once
+    it outgrows the table, or by compact.
+
+    The table is replaced atomically and the journal is only appended to, so
+    several processes may share the directory, though filters stored by one
+    may be dropped by another compacting at the same time.
+    '''
+    def __init__(self, cache_dir):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.table = None
+        self.table_stat = None
+        # The digests of the journal filters read so far, each with the
+        # (table, root) of its journal record.
+        self.journal = dict()
+        self.journal_id = None
+        self.journal_offset = 0
+
+    def path(self):
+        return os.path.join(self.cache_dir,
+                            'filters.v{}.jspfc'.format(FORMAT_VERSION))
+
+    def journal_path(self):
+        return os.path.join(self.cache_dir,
+                            'filters.v{}.journal'.format(FORMAT_VERSION))
+
+    def open_table(self):
+        '''
+        Map the table into memory unless it is mapped already and unchanged.
+        '''
+        try:
+            stat = os.stat(self.path())
+        except OSError:
+            (self.table, self.table_stat) = (None, None)
+            return
+        if self.table_stat is not None and \
+                (stat.st_ino, stat.st_mtime_ns) == self.table_stat:
+            return
+
+        (self.table, self.table_stat) = (None, None)
+        try:
+            with open(self.path(), 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.table = Table(data)
+        except (OSError, ValueError):
+            return
+        self.table_stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def read_journal(self):
+        '''
+        Read the records appended to the journal since it was last read.
+        '''
+        try:
+            f = open(self.journal_path(), 'rb')
+        except OSError:
+            (self.journal, self.journal_id, self.journal_offset) = \
+                (dict(), None, 0)
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if (stat.st_dev, stat.st_ino) != self.journal_id or \
+                    stat.st_size < self.journal_offset:
+                # Compacted since, this is a new journal.
+                (self.journal, self.journal_id, self.journal_offset) = \
+                    (dict(), (stat.st_dev, stat.st_ino), 0)
+            f.seek(self.journal_offset)
+            data = f.read()
+
+        offset = 0
+        while offset + JOURNAL_RECORD.size <= len(data):
+            (table_size,) = JOURNAL_RECORD.unpack_from(data, offset)
+            end = offset + JOURNAL_RECORD.size + table_size
+            if end > len(data):
+                # Still being appended.
+                break
+            try:
+                table = Table(data[offset+JOURNAL_RECORD.size:end])
+                for (prog_digest, root) in table.roots():
+                    self.journal[prog_digest] = (table, root)
+            except ValueError:
+                pass
+            offset = end
+        self.journal_offset += offset
+
+    def refresh(self):
+        self.open_table()
+        self.read_journal()
+
+    def load_mapped(self, prog):
+        tables = [self.table] if self.table is not None else []
+        prog_digest = digest(prog)
+        if prog_digest in self.journal:
+            tables.append(self.journal[prog_digest][0])
+        for table in tables:
+            try:
+                tree = table.load(prog)
+            except ValueError:
+                tree = None
+            if tree is not None:
+                return tree
+        return None
+
+    def load(self, prog):
+        '''
+        Return the cached parse tree of prog, or None on a cache miss.
+        '''
+        with self.lock:
+            tree = self.load_mapped(prog)
+            if tree is None:
+                # Another process may have stored it since.
+                self.refresh()
+                tree = self.load_mapped(prog)
+            return tree
+
+    def store_many(self, compiled):
+        '''
+        Append the (prog, tree) pairs of compiled to the journal.
+        '''
+        entries = [(digest(prog), tree) for (prog, tree) in compiled]
+        with self.lock:
+            self.refresh()
+            n_filters = 0 if self.table is None else self.table.n_filters
+            if len(self.journal) + len(entries) > \
+                    max(COMPACT_MIN_FILTERS, n_filters):
+                self.rewrite(entries)
+                return
+
+            data = encode(entries)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.journal_path(), 'ab') as f:
+                f.write(JOURNAL_RECORD.pack(len(data)) + data)
+            self.read_journal()
+
+    def store(self, prog, tree):
+        self.store_many([(prog, tree)])
+
+    def compact(self):
+        '''
+        Merge the journal into a new table.
+        '''
+        with self.lock:
+            self.refresh()
+            self.rewrite()
+
+    def rewrite(self, added=()):
+        '''
+        Write a new table of the filters of the table, the journal and added,
+        a list of (digest, tree), and remove the journal.
+        '''
+        import tempfile
+        entries = dict()
+        if self.table is not None:
+            try:
+                self.table.decode_all()
+                for (prog_digest, root) in self.table.roots():
+                    entries[prog_digest] = self.table.decode(root)
+            except ValueError:
+                entries = dict()
+        for (prog_digest, (table, root)) in self.journal.items():
+            try:
+                entries[prog_digest] = table.decode(root)
+            except ValueError:
+                pass
+        entries.update(added)
+        data = encode(entries.items())
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        try:
+            os.unlink(self.journal_path())
+        except FileNotFoundError:
+            pass
+        self.refresh()
+
+    def compile_many(self, progs):
+        '''
+        Like syntax.compile_many, skipping lexing and parsing of the filters
+        already cached and storing the others with a single append.
+
+        As with syntax.compile_many every tree is interned, so its tokens
+        carry no position, but identical subtrees are only shared among the
+        cached filters and among the others.
+        '''
+        trees = dict.fromkeys(progs)
+        with self.lock:
+            self.refresh()
+            if self.table is not None and \
+                    len(trees) * BULK_DECODE_RATIO >= self.table.n_filters:
+                try:
+                    self.table.decode_all()
+                except ValueError:
+                    (self.table, self.table_stat) = (None, None)
+            for prog in trees:
+                trees[prog] = self.load_mapped(prog)
+
+        missing = [prog for prog in trees if trees[prog] is None]
+        compiled = list()
+        for (prog, tree) in zip(missing, syntax.compile_many(missing)):
+            trees[prog] = tree
+            if not isinstance(tree, CompilerError):
+                compiled.append((prog, tree))
+        if len(compiled) > 0:
+            self.store_many(compiled)
+        return [trees[prog] for prog in progs]
+
+    def pass_syntax(self, prog):
+        '''
+        Like syntax.pass_syntax, skipping lexing and parsing when prog is
+        already cached. The tree is interned as by compile_many.
+        '''
+        [tree] = self.compile_many([prog])
+        if isinstance(tree, CompilerError):
+            raise tree
+        return tree
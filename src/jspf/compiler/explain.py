@@ -0,0 +1,168 @@
+from jspf.compiler import analysis
+from jspf.compiler import lexer
+from jspf.compiler import literal
+from jspf.compiler import syntax
+
+'''
+Human readable description of a compiled filter.
+'''
+
+BEGIN_TOKENS = {lexer.TokenType.SELECT_BEGIN,
+                lexer.TokenType.CAP_BEGIN,
+                lexer.TokenType.NONCAP_POS_BEGIN,
+                lexer.TokenType.NONCAP_NEG_BEGIN}
+END_TOKENS = {lexer.TokenType.SELECT_END}.union(lexer.BRACKET_END_TOKENS)
+LOOK_AHEAD_TOKENS = {lexer.TokenType.NONCAP_POS_BEGIN,
+                     lexer.TokenType.NONCAP_NEG_BEGIN}
+UNBOUNDED_QUANTIFIERS = {lexer.TokenType.DEFAULT_ANY,
+                         lexer.TokenType.DEFAULT_EXIST,
+                         lexer.TokenType.GREEDY_ANY,
+                         lexer.TokenType.GREEDY_EXIST,
+                         lexer.TokenType.LAZY_ANY,
+                         lexer.TokenType.LAZY_EXIST}
+
+def tokens(tree):
+    '''
+    Return the tokens of the tree in order.
+    '''
+    result = list()
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, syntax.Tree):
+            stack.extend(reversed(node.subtree))
+        else:
+            result.append(node)
+    return result
+
+def count_nodes(tree):
+    n_nodes = 0
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        n_nodes += 1
+        if isinstance(node, syntax.Tree):
+            stack.extend(node.subtree)
+    return n_nodes
+
+def structure(tree):
+    '''
+    Return the filter as lines, one per step, indented by bracket nesting.
+    '''
+    lines = list()
+    depth = 0
+    for token in tokens(tree):
+        token_type = token.token_type
+        if token_type in syntax.T_1ST or token_type in BEGIN_TOKENS:
+            lines.append('  ' * depth + token.lexeme)
+            if token_type in BEGIN_TOKENS:
+                depth += 1
+        elif token_type in END_TOKENS:
+            depth -= 1
+            lines.append('  ' * depth + token.lexeme)
+        elif token_type == lexer.TokenType.UNION:
+            lines.append('  ' * (depth-1) + token.lexeme)
+        else:
+            lines[-1] += token.lexeme
+    return lines
+
+def add_depth(a, b):
+    if a is None or b is None:
+        return None
+    return a + b
+
+def max_depth(a, b):
+    if a is None or b is None:
+        return None
+    return max(a, b)
+
+def depth(tree):
+    '''
+    Return (advance, reach) of the S tree: the number of navigations a match
+    takes and the deepest navigation it looks at, relative to where the match
+    starts. None stands for unbounded.
+    '''
+    (advance, reach) = (0, 0)
+    for (a_tree, q_tree) in analysis.sequence(tree):
+        first = a_tree.subtree[0]
+        if isinstance(first, syntax.Tree):
+            is_nav = first.subtree[0].token_type == lexer.TokenType.NAV
+            (a_advance, a_reach) = (int(is_nav), int(is_nav))
+        else:
+            (_, s_tree, u_tree, _) = a_tree.subtree
+            (a_advance, a_reach) = (0, 0)
+            for alt in analysis.alternatives(s_tree, u_tree):
+                (alt_advance, alt_reach) = depth(alt)
+                a_advance = max_depth(a_advance, alt_advance)
+                a_reach = max_depth(a_reach, alt_reach)
+            if first.token_type in LOOK_AHEAD_TOKENS:
+                a_advance = 0
+
+        if len(q_tree.subtree) > 0 and \
+                q_tree.subtree[0].token_type in UNBOUNDED_QUANTIFIERS and \
+                a_reach != 0:
+            (a_advance, a_reach) = (None, None)
+
+        reach = max_depth(reach, add_depth(advance, a_reach))
+        advance = add_depth(advance, a_advance)
+    return (advance, reach)
+
+def sequence_all(tree):
+    '''
+    Yield the (A, Q) subtrees of the S tree and of every bracket in it.
+    '''
+    stack = [tree]
+    while len(stack) > 0:
+        for (a_tree, q_tree) in analysis.sequence(stack.pop()):
+            yield (a_tree, q_tree)
+            if not isinstance(a_tree.subtree[0], syntax.Tree):
+                (_, s_tree, u_tree, _) = a_tree.subtree
+                stack.extend(analysis.alternatives(s_tree, u_tree))
+
+def cost_class(tree):
+    '''
+    A rough estimate of the matching cost: "linear" unless look aheads or
+    quantified brackets make the matcher backtrack.
+    '''
+    for (a_tree, q_tree) in sequence_all(tree):
+        first = a_tree.subtree[0]
+        if isinstance(first, syntax.Tree):
+            continue
+        if first.token_type in LOOK_AHEAD_TOKENS or len(q_tree.subtree) > 0:
+            return 'backtracking-bounded'
+    return 'linear'
+
+def explain(prog):
+    '''
+    Compile prog and describe the result as a dict. Raises CompilerError if
+    prog does not compile, including its regexes and intervals.
+    '''
+    tree = syntax.pass_syntax(prog)
+    literal.literals(tree)
+    filter_tokens = tokens(tree)
+    return {
+        'filter': ''.join(token.lexeme for token in filter_tokens),
+        'structure': structure(tree),
+        'tokens': len(filter_tokens),
+        'nodes': count_nodes(tree),
+        'required_keys': sorted(analysis.required_keys(tree)),
+        'max_depth': depth(tree)[1],
+        'cost': cost_class(tree),
+    }
+
+def format_report(report):
+    max_depth_repr = report['max_depth']
+    if max_depth_repr is None:
+        max_depth_repr = 'unbounded'
+    lines = [
+        'filter:        {}'.format(report['filter']),
+        'tokens:        {}'.format(report['tokens']),
+        'tree nodes:    {}'.format(report['nodes']),
+        'required keys: {}'.format(', '.join(map(repr, report['required_keys']))
+                                   or '(none)'),
+        'max depth:     {}'.format(max_depth_repr),
+        'cost:          {}'.format(report['cost']),
+        'structure:',
+    ]
+    lines.extend('    ' + line for line in report['structure'])
+    return '\n'.join(lines)
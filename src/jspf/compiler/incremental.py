@@ -0,0 +1,225 @@
+from jspf.compiler import lexer
+from jspf.compiler import syntax
+from jspf.compiler.CompilerError import CompilerError
+import bisect
+
+'''
+Incremental recompilation of a filter which is edited a little at a time.
+
+Only the edited region of the filter is lexed again: the tokens before it are
+kept, and lexing stops as soon as it reaches an old token after the edit with
+the same flag stack, from where on the old tokens are reused.
+
+Parsing works the same way on the top level items A Q of the filter, which are
+parsed independently of each other: the items before the edit are kept, and
+parsing stops as soon as it reaches the start of an old item after the edit.
+Of the chain of E trees holding the items, only the trees up to the edit are
+built again.
+
+All trees are interned in one Interner for the lifetime of the compiler, so
+every subtree which did not change is the very same object as before and
+results memoized per subtree stay valid. `fresh` holds the subtrees which
+appear for the first time, the only ones without memoized results. The tokens
+of the interned tree carry no position.
+'''
+
+# A token depends on at most this many characters from its start, in addition
+# to its own lexeme, e.g. "(" has to look at "(?=".
+LOOK_AHEAD = 3
+
+def common_prefix_len(a, b):
+    (lo, hi) = (0, min(len(a), len(b)))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def common_suffix_len(a, b, limit):
+    (lo, hi) = (0, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a)-mid:] == b[len(b)-mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def same_flags(a, b):
+    while a is not b:
+        if a is None or b is None or a[0] != b[0]:
+            return False
+        (a, b) = (a[1], b[1])
+    return True
+
+def tail_type(k):
+    return syntax.Node.S if k == 0 else syntax.Node.E
+
+class IncrementalCompiler:
+    def __init__(self):
+        super().__init__()
+        self.prog = ''
+        # Tokens after an edit are reused as they are, so the position of
+        # each token is the one in starts, not its prog_idx.
+        self.tokens = list()
+        self.starts = list()
+        # The flag stack after each token.
+        self.flags = list()
+        # The index of the first token of each top level item, and its (A, Q).
+        self.item_starts = list()
+        self.items = list()
+        # tails[k] is the tree of the items from k on: the S tree for k = 0
+        # and an E tree otherwise.
+        self.tails = list()
+        self.tree = None
+        self.fresh = list()
+        self.interner = syntax.Interner()
+
+    def positioned_tokens(self, tokens=None, starts=None, prog=None):
+        '''
+        Return the tokens with their prog_idx set to their current position.
+        '''
+        if tokens is None:
+            (tokens, starts, prog) = (self.tokens, self.starts, self.prog)
+        return [token if token.prog_idx == idx else
+                lexer.Token(prog, token.token_type, token.lexeme, idx)
+                for (token, idx) in zip(tokens, starts)]
+
+    def relex(self, prog):
+        '''
+        Return (tokens, starts, flags, n_kept, n_lexed, n_reused) for prog:
+        tokens[:n_kept] are kept from before the edit, the next n_lexed tokens
+        are lexed again, and the rest are the old tokens from n_reused on.
+        '''
+        old = self.prog
+        prefix = common_prefix_len(old, prog)
+        suffix = common_suffix_len(old, prog, min(len(old), len(prog)) - prefix)
+        delta = len(prog) - len(old)
+        edit_end = len(prog) - suffix
+
+        # Keep the tokens which only depend on the common prefix.
+        n_kept = bisect.bisect_right(self.starts, prefix - LOOK_AHEAD)
+        while n_kept > 0 and \
+                self.starts[n_kept-1] + len(self.tokens[n_kept-1].lexeme) > prefix:
+            n_kept -= 1
+
+        tokens = self.tokens[:n_kept]
+        starts = self.starts[:n_kept]
+        flags = self.flags[:n_kept]
+        (idx, cur_flags) = (0, lexer.ROOT_FLAGS)
+        if n_kept > 0:
+            idx = starts[-1] + len(tokens[-1].lexeme)
+            cur_flags = flags[-1]
+
+        n_reused = len(self.tokens)
+        for (token, token_flags) in lexer.lex(prog, idx, cur_flags):
+            if token.prog_idx >= edit_end:
+                # The old program is identical from here on, so once an old
+                # token starts here with the same flag stack, so do the rest.
+                old_idx = token.prog_idx - delta
+                j = bisect.bisect_left(self.starts, old_idx)
+                old_flags = self.flags[j-1] if j > 0 else lexer.ROOT_FLAGS
+                if j < len(self.starts) and self.starts[j] == old_idx and \
+                        same_flags(cur_flags, old_flags):
+                    n_reused = j
+                    break
+            tokens.append(token)
+            starts.append(token.prog_idx)
+            flags.append(token_flags)
+            cur_flags = token_flags
+
+        n_lexed = len(tokens) - n_kept
+        tokens.extend(self.tokens[n_reused:])
+        if delta == 0:
+            starts.extend(self.starts[n_reused:])
+        else:
+            starts.extend([idx + delta for idx in self.starts[n_reused:]])
+        flags.extend(self.flags[n_reused:])
+        return (tokens, starts, flags, n_kept, n_lexed, n_reused)
+
+    def reparse(self, tokens, n_kept, lexed_end, shift):
+        '''
+        Parse the items of tokens which changed. Returns (k_kept, item_starts,
+        parsed, k_reused): the first k_kept items are kept, parsed holds the
+        (A, Q) trees of the items starting at item_starts, and the old items
+        from k_reused on follow.
+        '''
+        # An item is kept if neither it nor the token after it, which the
+        # parser looks at to end the item, was lexed again.
+        n_items = len(self.items)
+        k_kept = max(bisect.bisect_left(self.item_starts, n_kept) - 1, 0)
+
+        parser = syntax.RecursiveDescentParser(tokens)
+        parser.nesting = 1
+        if k_kept < n_items:
+            parser.t_idx = self.item_starts[k_kept]
+        item_starts = list()
+        parsed = list()
+        while parser.cur() in syntax.A_1ST:
+            t_idx = parser.t_idx
+            if t_idx >= lexed_end:
+                k = bisect.bisect_left(self.item_starts, t_idx - shift)
+                if k < n_items and self.item_starts[k] == t_idx - shift:
+                    return (k_kept, item_starts, parsed, k)
+            item_starts.append(t_idx)
+            parsed.append((parser.p_A(), parser.p_Q()))
+
+        if parser.t_idx != len(tokens) or k_kept + len(parsed) == 0:
+            raise CompilerError('Unexpected token at token {}'.format(
+                parser.t_idx))
+        return (k_kept, item_starts, parsed, n_items)
+
+    def update(self, prog):
+        '''
+        Recompile after the filter was edited into prog and return its parse
+        tree. On a CompilerError the previous state is kept.
+        '''
+        (tokens, starts, flags, n_kept, n_lexed, n_reused) = self.relex(prog)
+        shift = n_kept + n_lexed - n_reused
+        try:
+            (k_kept, parsed_starts, parsed, k_reused) = self.reparse(
+                tokens, n_kept, n_kept + n_lexed, shift)
+        except CompilerError:
+            # Parse from scratch for the error message of the whole filter.
+            syntax.recursive_descent(self.positioned_tokens(tokens, starts, prog))
+            raise
+
+        fresh = list()
+        intern = self.interner.intern
+        items = self.items[:k_kept]
+        items.extend((intern(a_tree, fresh), intern(q_tree, fresh))
+                     for (a_tree, q_tree) in parsed)
+        k_changed = len(items)
+        items.extend(self.items[k_reused:])
+        item_starts = self.item_starts[:k_kept] + parsed_starts
+        item_starts.extend([idx + shift for idx in self.item_starts[k_reused:]])
+
+        # Build the chain from the last changed item backwards, until it
+        # meets the old chain.
+        if k_reused == len(self.items):
+            tail = self.interner.node(syntax.Node.E, [], fresh)
+        elif (k_reused == 0) == (k_changed == 0):
+            tail = self.tails[k_reused]
+        else:
+            tail = self.interner.node(tail_type(k_changed),
+                                      self.tails[k_reused].subtree,
+                                      fresh)
+        tails = [tail]
+        for k in range(k_changed - 1, -1, -1):
+            if k < k_kept and tail is self.tails[k+1]:
+                tails.extend(reversed(self.tails[:k+1]))
+                break
+            (a_tree, q_tree) = items[k]
+            tail = self.interner.node(tail_type(k), [a_tree, q_tree, tail],
+                                      fresh)
+            tails.append(tail)
+        tails.reverse()
+        tails.extend(self.tails[k_reused+1:])
+
+        (self.prog, self.tokens, self.starts, self.flags) = \
+            (prog, tokens, starts, flags)
+        (self.item_starts, self.items, self.tails) = (item_starts, items, tails)
+        (self.tree, self.fresh) = (tails[0], fresh)
+        return self.tree
@@ -37,6 +37,8 @@ class Flag(Enum):
     NONCAP_NEG_ENABLE   = 3
 
 class Token:
+    __slots__ = ('prog', 'token_type', 'lexeme', 'prog_idx')
+
     def __init__(self, prog, token_type, lexeme, prog_idx):
         super().__init__()
         self.prog = prog
@@ -121,7 +123,7 @@ def tokenize_select(prog, idx, flag):
 
 def tokenize_bracket_begin(prog, idx, flag):
     (token_type, lexeme, next_idx) = (None, None, None)
-    look_ahead = len(prog) > idx+3
+    look_ahead = len(prog) >= idx+3
     if look_ahead and prog[idx:idx+3] == '(?=':
         token_type = TokenType.NONCAP_POS_BEGIN
         lexeme = '(?='
@@ -158,7 +160,7 @@ def tokenize_union(prog, idx, flag):
 
 def tokenize_quantifier_optional(prog, idx, flag):
     (token_type, lexeme, next_idx) = (None, None, None)
-    look_ahead = len(prog) > idx+2
+    look_ahead = len(prog) >= idx+2
     if look_ahead and prog[idx:idx+2] == '??':
         token_type = TokenType.LAZY_OPTIONAL
         lexeme = '??'
@@ -175,7 +177,7 @@ def tokenize_quantifier_optional(prog, idx, flag):
 
 def tokenize_quantifier_any(prog, idx, flag):
     (token_type, lexeme, next_idx) = (None, None, None)
-    look_ahead = len(prog) > idx+2
+    look_ahead = len(prog) >= idx+2
     if look_ahead and prog[idx:idx+2] == '*?':
         token_type = TokenType.LAZY_ANY
         lexeme = '*?'
@@ -192,7 +194,7 @@ def tokenize_quantifier_any(prog, idx, flag):
 
 def tokenize_quantifier_exist(prog, idx, flag):
     (token_type, lexeme, next_idx) = (None, None, None)
-    look_ahead = len(prog) > idx+2
+    look_ahead = len(prog) >= idx+2
     if look_ahead and prog[idx:idx+2] == '+?':
         token_type = TokenType.LAZY_EXIST
         lexeme = '+?'
@@ -240,21 +242,25 @@ def advance(prog, idx, flag):
 
     return tokenizer_f(prog, idx, flag)
 
-def pass_lexer(prog):
-    tokens = list()
-    flags = list()
-    flags.append(Flag.NONE)
-    idx = 0
+# The flag stack is kept as nested pairs (flag, rest of the stack), so the
+# stack after every token can be kept without copying it.
+ROOT_FLAGS = (Flag.NONE, None)
+
+def lex(prog, idx=0, flags=ROOT_FLAGS):
+    '''
+    Yield (token, flags) for every token of prog[idx:], where flags is the flag
+    stack after the token.
+    '''
     while idx < len(prog):
-        (token_type, lexeme, next_idx) = advance(prog, idx, flags[-1])
+        (token_type, lexeme, next_idx) = advance(prog, idx, flags[0])
         if token_type == TokenType.CAP_BEGIN:
-            flags.append(Flag.CAP_ENABLE)            
+            flags = (Flag.CAP_ENABLE, flags)
         elif token_type == TokenType.NONCAP_POS_BEGIN:
-            flags.append(Flag.NONCAP_POS_ENABLE)
+            flags = (Flag.NONCAP_POS_ENABLE, flags)
         elif token_type == TokenType.NONCAP_NEG_BEGIN:
-            flags.append(Flag.NONCAP_NEG_ENABLE)
+            flags = (Flag.NONCAP_NEG_ENABLE, flags)
         elif token_type in BRACKET_END_TOKENS:
-            flags.pop()
+            flags = flags[1]
 
         if token_type == TokenType.INVALID:
             raise CompilerError('Invalid token at byte {} "{}..."'.format(
@@ -262,12 +268,12 @@ def pass_lexer(prog):
                 prog[idx:min(len(prog) ,idx+5)]))
 
         if token_type != TokenType.WHITESPACE:
-            node = Token(prog, token_type, lexeme, idx)
-            tokens.append(node)
+            yield (Token(prog, token_type, lexeme, idx), flags)
 
         idx = next_idx
 
-    return tokens
+def pass_lexer(prog):
+    return [token for (token, _) in lex(prog)]
 
 TOKEN_NAMES = {
     TokenType.NAV: '.',
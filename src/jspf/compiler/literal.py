@@ -0,0 +1,197 @@
+from jspf.compiler import analysis
+from jspf.compiler import lexer
+from jspf.compiler import syntax
+from jspf.compiler.CompilerError import CompilerError
+import bisect
+import math
+import re
+
+'''
+Compiled forms of the STR_MATCH, REGEX and SET_MATCH tokens of a filter.
+
+Keys and string values are compared against the raw bytes of the input, the
+UTF-8 text between the quotes of a JSON string, and only decoded when that
+cannot give the same answer: when the raw string contains an escape sequence,
+or when a regex has to see non-ASCII text.
+'''
+
+NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+
+NUMBER_RE = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+# Integers up to this magnitude are exact as floats.
+MAX_EXACT_INT = 1 << 53
+
+def encode_raw(text):
+    '''
+    Return the raw bytes a JSON encoder writes for the string text, without
+    the quotes and escaping only what JSON requires.
+    '''
+    import json
+    return json.dumps(text, ensure_ascii=False)[1:-1].encode('utf-8',
+                                                             'surrogatepass')
+
+def decode_raw(raw):
+    '''
+    Return the string of the raw bytes of a JSON string.
+    '''
+    if b'\\' not in raw:
+        return raw.decode('utf-8')
+    import json
+    return json.loads(b'"' + raw + b'"')
+
+class StrLiteral:
+    def __init__(self, lexeme):
+        super().__init__()
+        self.text = analysis.str_match_text(lexeme)
+        self.raw = encode_raw(self.text)
+
+    def matches_raw(self, raw):
+        '''
+        Whether the JSON string with the raw bytes raw equals the literal.
+        '''
+        if b'\\' not in raw:
+            # Without escapes there is only one way to write a string.
+            return raw == self.raw
+        return decode_raw(raw) == self.text
+
+class RegexLiteral:
+    def __init__(self, lexeme):
+        super().__init__()
+        self.text = lexeme[1:-1]
+        try:
+            self.str_re = re.compile(self.text)
+        except re.error as e:
+            raise CompilerError('Invalid regex {} ({})'.format(lexeme, e))
+        self.bytes_re = None
+        if NON_ASCII_RE.search(self.text.encode('utf-8')) is None:
+            try:
+                self.bytes_re = re.compile(self.text.encode('ascii'))
+            except re.error:
+                # Escapes such as \u, \U and \N{...} only exist in str
+                # patterns.
+                pass
+
+    def for_raw(self, raw):
+        '''
+        Return (pattern, subject) to match the JSON string with the raw bytes
+        raw: the bytes pattern and raw itself when both are ASCII, where bytes
+        and str patterns agree, and the str pattern and the decoded string
+        otherwise.
+        '''
+        if self.bytes_re is not None and b'\\' not in raw and \
+                NON_ASCII_RE.search(raw) is None:
+            return (self.bytes_re, raw)
+        return (self.str_re, decode_raw(raw))
+
+def parse_number(text):
+    if NUMBER_RE.fullmatch(text) is None:
+        raise CompilerError('Invalid number "{}" in interval'.format(text))
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    number = float(text)
+    if math.isinf(number):
+        raise CompilerError('Invalid number "{}" in interval'.format(text))
+    return number
+
+def is_exact_float(number):
+    '''
+    Whether number converts to a float without rounding.
+    '''
+    return not isinstance(number, int) or \
+        -MAX_EXACT_INT <= number <= MAX_EXACT_INT
+
+class IntervalLiteral:
+    '''
+    The set of numbers of a SET_MATCH token, e.g. "{-5, ..., 5, 10, 15, ...}"
+    is [-5, 5] u {10} u [15, INF), kept as sorted disjoint closed ranges.
+    '''
+    def __init__(self, lexeme):
+        super().__init__()
+        items = [item.strip() for item in lexeme[1:-1].split(',')]
+        self.lows = list()
+        self.highs = list()
+        idx = 0
+        while idx < len(items):
+            if items[idx] == '...':
+                (low, high) = (-math.inf, None)
+            else:
+                low = parse_number(items[idx])
+                (high, idx) = (low, idx+1)
+            if idx < len(items) and items[idx] == '...':
+                idx += 1
+                high = math.inf
+                if idx < len(items):
+                    high = parse_number(items[idx])
+                    idx += 1
+            if high is None or high < low or \
+                    (len(self.highs) > 0 and low <= self.highs[-1]):
+                raise CompilerError('Invalid interval {}'.format(lexeme))
+            self.lows.append(low)
+            self.highs.append(high)
+
+    def contains(self, number):
+        idx = bisect.bisect_right(self.lows, number) - 1
+        return idx >= 0 and number <= self.highs[idx]
+
+    def contains_many(self, numbers):
+        '''
+        Return a list of whether each of numbers is in the interval, testing
+        them all at once with NumPy when it is installed and all numbers are
+        exact as floats.
+        '''
+        try:
+            import numpy
+        except ImportError:
+            return list(map(self.contains, numbers))
+        numbers = list(numbers)
+        if not all(map(is_exact_float, self.lows)) or \
+                not all(map(is_exact_float, self.highs)) or \
+                not all(map(is_exact_float, numbers)):
+            return list(map(self.contains, numbers))
+
+        numbers = numpy.asarray(numbers, dtype=float)
+        idx = numpy.searchsorted(numpy.asarray(self.lows, dtype=float),
+                                 numbers,
+                                 side='right') - 1
+        highs = numpy.asarray(self.highs, dtype=float)
+        return ((idx >= 0) & (numbers <= highs[numpy.maximum(idx, 0)])).tolist()
+
+LITERALS = {
+    lexer.TokenType.STR_MATCH: StrLiteral,
+    lexer.TokenType.REGEX: RegexLiteral,
+    lexer.TokenType.SET_MATCH: IntervalLiteral,
+}
+
+def literals(tree):
+    '''
+    Return a dict from the lexeme of every STR_MATCH, REGEX and SET_MATCH
+    token of the tree to its literal, compiling each distinct lexeme once.
+    '''
+    result = dict()
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, syntax.Tree):
+            stack.extend(node.subtree)
+        elif node.token_type in LITERALS and node.lexeme not in result:
+            result[node.lexeme] = LITERALS[node.token_type](node.lexeme)
+    return result
+
+class KeyPrefilter:
+    '''
+    Rejects documents which cannot contain every key required by a filter by
+    searching for the raw keys in the undecoded document.
+    '''
+    def __init__(self, tree):
+        super().__init__()
+        self.needles = [b'"' + encode_raw(key) + b'"'
+                        for key in sorted(analysis.required_keys(tree))]
+
+    def may_match(self, doc):
+        if all(needle in doc for needle in self.needles):
+            return True
+        # A key may also be written with escapes, which only decoding finds.
+        return b'\\' in doc
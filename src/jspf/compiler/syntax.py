@@ -17,7 +17,7 @@ A --> (?=SU)
 A --> TC
 
 U --> (lambda)
-U --> |S
+U --> |SU
 
 C --> (lambda)
 C --> lexeme.TokenType.REGEX
@@ -38,8 +38,15 @@ Q --> lexeme.TokenType.LAZY_EXIST
 T --> lexeme.TokenType.NAV
 T --> lexeme.TokenType.VAL
 T --> lexeme.TokenType.ROOT
+
+E and U are parsed iteratively so neither long filters nor wide unions are
+limited by the recursion limit. The U chain is kept flat: a U tree holds the
+tokens and S trees of all of its alternatives, |S|S...|S. Brackets are still
+parsed recursively and may be nested at most MAX_NESTING deep.
 '''
 
+MAX_NESTING = 100
+
 T_1ST = {lexer.TokenType.NAV,
          lexer.TokenType.VAL,
          lexer.TokenType.ROOT}
@@ -80,6 +87,8 @@ class Node(Enum):
     T = 6
 
 class Tree:
+    __slots__ = ('node_type', 'subtree')
+
     def __init__(self, node_type):
         self.node_type = node_type
         self.subtree = list()
@@ -88,13 +97,31 @@ class Tree:
         return str(self.to_dict())
 
     def to_dict(self):
-        subtree_repr = list(map(lambda st: st.to_dict(), self.subtree))
-        return {str(self.node_type): subtree_repr}
+        # Iterative post order, so deep trees do not hit the recursion limit.
+        stack = [(self, False)]
+        reprs = list()
+        while len(stack) > 0:
+            (node, visited) = stack.pop()
+            if not isinstance(node, Tree):
+                reprs.append(node.to_dict())
+
+            elif not visited:
+                stack.append((node, True))
+                stack.extend((st, False) for st in reversed(node.subtree))
+
+            else:
+                n_subtree = len(node.subtree)
+                subtree_repr = reprs[len(reprs)-n_subtree:]
+                del reprs[len(reprs)-n_subtree:]
+                reprs.append({str(node.node_type): subtree_repr})
+
+        return reprs[0]
 
 class RecursiveDescentParser:
     def __init__(self, tokens):
         self.tokens = tokens
         self.t_idx = 0
+        self.nesting = 0
 
     def cur(self):
         if self.t_idx == len(self.tokens):
@@ -115,6 +142,10 @@ class RecursiveDescentParser:
             self.err({token_type})
 
     def err(self, expected_token_types):
+        if self.t_idx == len(self.tokens):
+            raise CompilerError('Unexpected end of filter at token {}'.format(
+                self.t_idx))
+
         token = self.tokens[self.t_idx]
         err_msg = 'Unexpected token {} "{}" at token {} (byte {})'.format(
             lexer.TOKEN_NAMES[token.token_type],
@@ -123,6 +154,14 @@ class RecursiveDescentParser:
             token.prog_idx) 
         raise CompilerError(err_msg)        
 
+    def err_nesting(self):
+        token = self.tokens[self.t_idx-1]
+        err_msg = 'Brackets nested deeper than {} at token {} (byte {})'.format(
+            MAX_NESTING,
+            self.t_idx-1,
+            token.prog_idx)
+        raise CompilerError(err_msg)
+
     def p_T(self):
         tree = Tree(Node.T)
 
@@ -165,14 +204,11 @@ class RecursiveDescentParser:
     def p_U(self):
         tree = Tree(Node.U)
 
-        if self.cur() == lexer.TokenType.UNION:
+        while self.cur() == lexer.TokenType.UNION:
             tree.subtree.append(self.eat(lexer.TokenType.UNION))
             tree.subtree.append(self.p_S())
 
-        elif self.cur() in U_FOL:
-            pass
-
-        else:
+        if self.cur() not in U_FOL:
             self.err(U_1ST)
 
         return tree
@@ -216,15 +252,14 @@ class RecursiveDescentParser:
     def p_E(self):
         tree = Tree(Node.E)
 
-        if self.cur() in A_1ST:
-            tree.subtree.append(self.p_A())
-            tree.subtree.append(self.p_Q())
-            tree.subtree.append(self.p_E())
+        tail = tree
+        while self.cur() in A_1ST:
+            tail.subtree.append(self.p_A())
+            tail.subtree.append(self.p_Q())
+            tail.subtree.append(Tree(Node.E))
+            tail = tail.subtree[-1]
 
-        elif self.cur() in E_FOL:
-            pass
-
-        else:
+        if self.cur() not in E_FOL:
             self.err(E_1ST)
 
         return tree
@@ -232,6 +267,10 @@ class RecursiveDescentParser:
     def p_S(self):
         tree = Tree(Node.S)
 
+        self.nesting += 1
+        if self.nesting > MAX_NESTING:
+            self.err_nesting()
+
         if self.cur() in A_1ST:
             tree.subtree.append(self.p_A())
             tree.subtree.append(self.p_Q())
@@ -240,14 +279,106 @@ class RecursiveDescentParser:
         else:
             self.err(S_1ST)
 
+        self.nesting -= 1
         return tree
 
 def recursive_descent(tokens):
-    raise NotImplementedError()
-
-def pass_syntax(prog):
-    tokens = lexer.pass_lexer(prog)
     parser = RecursiveDescentParser(tokens)
     tree = parser.p_S()
-    assert parser.t_idx == len(tokens)
+    if parser.t_idx != len(tokens):
+        parser.err({None})
     return tree
+
+def pass_syntax(prog):
+    '''
+    Compile prog into its parse tree.
+
+    Every call uses its own parser and nothing else is shared between calls,
+    so filters may be compiled concurrently from many threads. The returned
+    tree is never modified afterwards and may be shared between threads.
+    '''
+    return recursive_descent(lexer.pass_lexer(prog))
+
+class Interner:
+    '''
+    Shares structurally identical subtrees and tokens between parse trees.
+
+    Tokens are identified by their type and lexeme alone, so interned tokens
+    carry no position: their prog and prog_idx are None.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.tokens = dict()
+        self.trees = dict()
+
+    def intern_token(self, token):
+        key = (token.token_type, token.lexeme)
+        interned = self.tokens.get(key, None)
+        if interned is None:
+            interned = lexer.Token(None, token.token_type, token.lexeme, None)
+            self.tokens[key] = interned
+        return interned
+
+    def node(self, node_type, subtree, created=None):
+        '''
+        Return the interned tree of node_type whose subtrees are the already
+        interned subtree. A tree made here for the first time is appended to
+        created, if it is given.
+        '''
+        key = (node_type, tuple(map(id, subtree)))
+        shared = self.trees.get(key, None)
+        if shared is None:
+            shared = Tree(node_type)
+            shared.subtree = list(subtree)
+            self.trees[key] = shared
+            if created is not None:
+                created.append(shared)
+        return shared
+
+    def intern(self, tree, created=None):
+        '''
+        Return the interned tree structurally identical to tree. Trees which
+        were not interned before are copied, so tree itself is not modified.
+        '''
+        # Iterative post order, so deep trees do not hit the recursion limit.
+        stack = [(tree, False)]
+        interned = list()
+        while len(stack) > 0:
+            (node, visited) = stack.pop()
+            if not isinstance(node, Tree):
+                interned.append(self.intern_token(node))
+
+            elif not visited:
+                stack.append((node, True))
+                stack.extend((st, False) for st in reversed(node.subtree))
+
+            else:
+                n_subtree = len(node.subtree)
+                subtree = interned[len(interned)-n_subtree:]
+                del interned[len(interned)-n_subtree:]
+                interned.append(self.node(node.node_type, subtree, created))
+
+        return interned[0]
+
+def compile_many(progs, interner=None):
+    '''
+    Compile every filter in progs.
+
+    Identical filters are compiled once and identical subtrees, regexes and
+    intervals are stored once across all filters. Returns a list holding, for
+    each filter in order, either its parse tree or the CompilerError raised
+    compiling it.
+    '''
+    if interner is None:
+        interner = Interner()
+
+    compiled = dict()
+    results = list()
+    for prog in progs:
+        if prog not in compiled:
+            try:
+                compiled[prog] = interner.intern(pass_syntax(prog))
+            except CompilerError as e:
+                compiled[prog] = e
+        results.append(compiled[prog])
+    return results
@@ -0,0 +1,229 @@
+from jspf import backend
+from jspf import stream
+from jspf.compiler import analysis
+from jspf.compiler import syntax
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+'''
+Inverted key index over a corpus of JSON documents.
+
+An index maps every object key to the sorted ordinals of the documents of the
+corpus containing that key, and every ordinal to the byte span of its
+document. A filter which must navigate into "[foo]" and "[bar]" then only has
+to look at the documents containing both keys.
+
+Layout, all integers little endian:
+
+HEADER --> MAGIC VERSION n_docs n_keys corpus_size corpus_mtime_ns
+DOCS   --> (offset length){n_docs}
+KEYS   --> (key_offset key_length postings_offset n_postings){n_keys}
+then the postings, each a uint32 ordinal, and the UTF-8 keys. KEYS is sorted
+by key bytes so keys are looked up by binary search on the mapped file.
+
+The size and modification time of the corpus the index was built from are
+kept in HEADER, so an index is never used with a corpus changed since.
+'''
+
+MAGIC = b'JSPI'
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct('<4sH2xIIQq')
+DOC_RECORD = struct.Struct('<QQ')
+KEY_RECORD = struct.Struct('<QQQQ')
+POSTING = struct.Struct('<I')
+
+def encode_key(key):
+    return key.encode('utf-8', 'surrogatepass')
+
+def document_keys(doc):
+    keys = set()
+    stack = [doc]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, dict):
+            keys.update(node.keys())
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return keys
+
+def corpus_stamp(f):
+    '''
+    Return the (size, mtime_ns) of the open corpus file f.
+    '''
+    stat = os.fstat(f.fileno())
+    return (stat.st_size, stat.st_mtime_ns)
+
+def build(corpus_path, index_path, json_backend=None):
+    '''
+    Scan the corpus of JSON documents at corpus_path once and write its index
+    to index_path.
+    '''
+    if json_backend is None:
+        json_backend = backend.select_backend()
+
+    spans = list()
+    postings = dict()
+    with open(corpus_path, 'rb') as f:
+        (corpus_size, corpus_mtime_ns) = corpus_stamp(f)
+        for (ordinal, (offset, doc)) in enumerate(stream.iter_spans(f)):
+            spans.append((offset, len(doc)))
+            for key in document_keys(json_backend.loads(doc)):
+                postings.setdefault(encode_key(key), list()).append(ordinal)
+
+    keys = sorted(postings.keys())
+    chunks = [HEADER.pack(MAGIC,
+                          FORMAT_VERSION,
+                          len(spans),
+                          len(keys),
+                          corpus_size,
+                          corpus_mtime_ns)]
+    chunks.extend(DOC_RECORD.pack(offset, length) for (offset, length) in spans)
+
+    postings_offset = HEADER.size + DOC_RECORD.size*len(spans) + \
+        KEY_RECORD.size*len(keys)
+    key_offset = postings_offset + POSTING.size*sum(map(len, postings.values()))
+    postings_blob = array.array('I')
+    for key in keys:
+        chunks.append(KEY_RECORD.pack(key_offset,
+                                      len(key),
+                                      postings_offset,
+                                      len(postings[key])))
+        key_offset += len(key)
+        postings_offset += POSTING.size*len(postings[key])
+        postings_blob.extend(postings[key])
+    if sys.byteorder == 'big':
+        postings_blob.byteswap()
+    chunks.append(postings_blob.tobytes())
+    chunks.extend(keys)
+
+    import tempfile
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    (fd, tmp_path) = tempfile.mkstemp(dir=index_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(chunks)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class Index:
+    def __init__(self, index_path):
+        super().__init__()
+        with open(index_path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_docs, self.n_keys,
+         self.corpus_size, self.corpus_mtime_ns) = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError('Unsupported index format')
+        self.keys_offset = HEADER.size + DOC_RECORD.size*self.n_docs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def check_corpus(self, f):
+        '''
+        Raise ValueError unless the open corpus file f is the one the index
+        was built from, unchanged since.
+        '''
+        if corpus_stamp(f) != (self.corpus_size, self.corpus_mtime_ns):
+            raise ValueError('Corpus changed since the index was built')
+
+    def span(self, ordinal):
+        '''
+        Return the (offset, length) of the document ordinal in the corpus.
+        '''
+        return DOC_RECORD.unpack_from(self.data,
+                                      HEADER.size + DOC_RECORD.size*ordinal)
+
+    def key_record(self, idx):
+        return KEY_RECORD.unpack_from(self.data,
+                                      self.keys_offset + KEY_RECORD.size*idx)
+
+    def key_at(self, idx):
+        (key_offset, key_length, _, _) = self.key_record(idx)
+        return self.data[key_offset:key_offset+key_length]
+
+    def postings(self, key):
+        '''
+        Return the sorted ordinals of the documents containing key.
+        '''
+        key = encode_key(key)
+        (lo, hi) = (0, self.n_keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n_keys or self.key_at(lo) != key:
+            return Postings(self.data, 0, 0)
+
+        (_, _, postings_offset, n_postings) = self.key_record(lo)
+        return Postings(self.data, postings_offset, n_postings)
+
+    def candidates(self, tree):
+        '''
+        Return the sorted ordinals of the documents which may match the parse
+        tree, i.e. those containing every key required by the filter.
+        '''
+        keys = analysis.required_keys(tree)
+        if len(keys) == 0:
+            return range(self.n_docs)
+
+        postings = sorted(map(self.postings, keys), key=len)
+        ordinals = list(postings[0])
+        for others in postings[1:]:
+            ordinals = [o for o in ordinals if contains(others, o)]
+        return ordinals
+
+class Postings:
+    '''
+    A read only sequence of the ordinals of a key, read lazily from the mapped
+    index so long postings are only binary searched and never copied.
+    '''
+    def __init__(self, data, offset, n_postings):
+        super().__init__()
+        self.data = data
+        self.offset = offset
+        self.n_postings = n_postings
+
+    def __len__(self):
+        return self.n_postings
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= self.n_postings:
+            raise IndexError(idx)
+        return POSTING.unpack_from(self.data, self.offset + POSTING.size*idx)[0]
+
+def contains(ordinals, ordinal):
+    idx = bisect.bisect_left(ordinals, ordinal)
+    return idx < len(ordinals) and ordinals[idx] == ordinal
+
+def query(corpus_path, index_path, prog):
+    '''
+    Yield (offset, document) for the documents of the corpus which may match
+    the filter prog. Raises ValueError if the corpus changed since the index
+    was built.
+    '''
+    tree = syntax.pass_syntax(prog)
+    with Index(index_path) as index, open(corpus_path, 'rb') as f:
+        index.check_corpus(f)
+        for ordinal in index.candidates(tree):
+            (offset, length) = index.span(ordinal)
+            f.seek(offset)
+            yield (offset, f.read(length))
@@ -0,0 +1,495 @@
+from jspf import backend
+import os
+import re
+import time
+
+'''
+Splitting of a byte stream into JSON documents.
+
+The input of jspf is a stream of JSON documents delimited by arbitrary many
+white space characters. The Splitter finds the document boundaries without
+parsing, so only the bytes of the document being scanned are buffered. With
+unwrap enabled, the elements of top level arrays are split out instead, which
+lets a single huge array of records be processed one record at a time.
+'''
+
+CHUNK_SIZE = 1 << 16
+
+# Bounds of the adaptive sleep of follow while the file does not grow.
+FOLLOW_MIN_DELAY = 0.005
+FOLLOW_MAX_DELAY = 0.25
+
+def open_gzip(f):
+    import gzip
+    return gzip.GzipFile(fileobj=f)
+
+def open_bz2(f):
+    import bz2
+    return bz2.BZ2File(f)
+
+def open_lzma(f):
+    import lzma
+    return lzma.LZMAFile(f)
+
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', open_gzip),
+    (b'BZh', open_bz2),
+    (b'\xfd7zXZ\x00', open_lzma),
+]
+
+BEGIN = b'[{'
+END = b']}'
+
+# A string, a bracket, a comma, white space, or a run of anything else (which
+# is a number or a literal unless the input is malformed).
+TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},]|\s+|[^\s\[\]{},"]+',
+                      re.DOTALL)
+
+# Everything inside a container up to the next bracket.
+INSIDE_RE = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")+', re.DOTALL)
+
+# The rest of a string up to its closing quote, or up to the end of the buffer
+# or a trailing backslash if the string continues in the next chunk.
+STRING_REST_RE = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+class Splitter:
+    def __init__(self, unwrap=False):
+        super().__init__()
+        self.unwrap = unwrap
+        self.base = 1 if unwrap else 0
+        self.buf = bytearray()
+        # Stream offset of buf[0].
+        self.offset = 0
+        self.scan_idx = 0
+        self.doc_idx = None
+        # Index of the opening quote of a string which is not complete yet.
+        self.string_idx = None
+        self.depth = 0
+
+    def err(self, msg, idx):
+        raise ValueError('{} at byte {}'.format(msg, self.offset+idx))
+
+    def feed(self, data):
+        '''
+        Consume the next chunk of the stream.
+
+        Returns a list of (offset, document) pairs for the documents completed
+        by this chunk, where document is the bytes of the document and offset
+        is the position of its first byte in the stream.
+        '''
+        self.buf += data
+        return self.scan(False)
+
+    def close(self):
+        '''
+        Signal the end of the stream and return the remaining documents.
+        '''
+        docs = self.scan(True)
+        if self.depth > 0 or self.scan_idx < len(self.buf):
+            self.err('Incomplete JSON document', self.scan_idx)
+        return docs
+
+    def scan(self, eof):
+        docs = list()
+        buf = self.buf
+        idx = self.scan_idx
+        while idx < len(buf):
+            if self.string_idx is not None:
+                # Resume the open string where the previous chunk ended, so a
+                # long string is scanned once rather than once per chunk.
+                idx = STRING_REST_RE.match(buf, idx).end()
+                if idx == len(buf) or buf[idx] != ord('"'):
+                    break
+                (string_idx, self.string_idx) = (self.string_idx, None)
+                idx += 1
+                if self.depth == self.base:
+                    docs.append((self.offset+string_idx,
+                                 bytes(buf[string_idx:idx])))
+                continue
+
+            if self.depth > self.base:
+                m = INSIDE_RE.match(buf, idx)
+                if m is not None:
+                    idx = m.end()
+                    continue
+
+            m = TOKEN_RE.match(buf, idx)
+            if m is None:
+                # Only an unterminated string does not match.
+                if self.depth < self.base:
+                    self.err('Expected a JSON array', idx)
+                self.string_idx = idx
+                idx = STRING_REST_RE.match(buf, idx+1).end()
+                break
+
+            ch = buf[idx:idx+1]
+            end_idx = m.end()
+            if ch.isspace():
+                pass
+
+            elif ch in BEGIN:
+                if self.depth == self.base:
+                    self.doc_idx = idx
+                elif self.depth == 0 and ch != b'[':
+                    self.err('Expected a JSON array', idx)
+                self.depth += 1
+
+            elif ch in END:
+                if self.depth == 0:
+                    self.err('Unbalanced "{}"'.format(ch.decode()), idx)
+                self.depth -= 1
+                if self.depth == self.base:
+                    docs.append((self.offset+self.doc_idx,
+                                 bytes(buf[self.doc_idx:end_idx])))
+                    self.doc_idx = None
+
+            elif ch == b',':
+                if self.depth != self.base or not self.unwrap:
+                    self.err('Unexpected ","', idx)
+
+            elif self.depth == self.base:
+                # A scalar document, which may continue in the next chunk
+                # unless it is a complete string.
+                if end_idx == len(buf) and ch != b'"' and not eof:
+                    break
+                docs.append((self.offset+idx, bytes(buf[idx:end_idx])))
+
+            else:
+                self.err('Expected a JSON array', idx)
+
+            idx = end_idx
+
+        if eof and self.string_idx is not None:
+            self.err('Unterminated string', self.string_idx)
+
+        keep_idx = idx
+        if self.doc_idx is not None:
+            keep_idx = self.doc_idx
+        elif self.string_idx is not None:
+            keep_idx = self.string_idx
+        del buf[:keep_idx]
+        self.offset += keep_idx
+        self.scan_idx = idx - keep_idx
+        if self.doc_idx is not None:
+            self.doc_idx = 0
+        if self.string_idx is not None:
+            self.string_idx -= keep_idx
+        return docs
+
+def iter_spans(fp, unwrap=False, chunk_size=CHUNK_SIZE):
+    '''
+    Yield (offset, document) pairs from the binary file fp.
+    '''
+    splitter = Splitter(unwrap)
+    while True:
+        data = fp.read(chunk_size)
+        if len(data) == 0:
+            break
+        yield from splitter.feed(data)
+    yield from splitter.close()
+
+def iter_documents(fp, unwrap=False, json_backend=None, chunk_size=CHUNK_SIZE):
+    '''
+    Yield the parsed documents of the binary file fp.
+    '''
+    if json_backend is None:
+        json_backend = backend.select_backend()
+    for (_, doc) in iter_spans(fp, unwrap, chunk_size):
+        yield json_backend.loads(doc)
+
+def sampler(probability, seed=0, salt=b''):
+    '''
+    Return a function of the offset of a document telling whether it is kept,
+    with the given probability.
+
+    Whether a document is kept only depends on seed, salt and its offset, so
+    it is decided before the document is parsed or even looked at, and is the
+    same in every run and every worker. Pass e.g. the file name as salt, str
+    or bytes, when sampling many files.
+    '''
+    import hashlib
+    if isinstance(salt, str):
+        salt = salt.encode('utf-8', 'surrogateescape')
+    threshold = int(probability * (1 << 64))
+    key = seed.to_bytes(8, 'little', signed=True)
+
+    def keep(offset):
+        digest = hashlib.blake2b(salt + offset.to_bytes(8, 'little'),
+                                 digest_size=8,
+                                 key=key).digest()
+        return int.from_bytes(digest, 'little') < threshold
+    return keep
+
+def sample(spans, probability, seed=0, salt=b''):
+    '''
+    Yield the (offset, document) pairs of spans kept as by sampler.
+
+    The documents skipped are not parsed, but they are still split, which
+    costs between 60% and 90% of a full iter_documents pass over newline
+    delimited input, whatever the probability. Use sample_lines for such
+    input.
+    '''
+    keep = sampler(probability, seed, salt)
+    for (offset, doc) in spans:
+        if keep(offset):
+            yield (offset, doc)
+
+def sample_lines(fp, probability, seed=0, salt=b''):
+    '''
+    Yield the (offset, document) pairs of the binary file fp of newline
+    delimited documents whose line is kept as by sampler, keyed by the offset
+    of the line.
+
+    Only the kept lines are split, so the others merely cost finding their
+    end. Unless a line starts with white space this keeps the same documents
+    as sample(iter_spans(fp), ...), and a kept line which does not hold whole
+    documents raises ValueError.
+    '''
+    keep = sampler(probability, seed, salt)
+    offset = 0
+    for line in fp:
+        if keep(offset):
+            splitter = Splitter()
+            splitter.offset = offset
+            yield from splitter.feed(line)
+            yield from splitter.close()
+        offset += len(line)
+
+def rate_limit(items, rate, clock_f=time.monotonic):
+    '''
+    Yield items at no more than rate per second on average, with bursts of up
+    to rate items but at least one, and drop the rest unseen.
+    '''
+    capacity = max(rate, 1)
+    allowance = capacity
+    last = clock_f()
+    for item in items:
+        now = clock_f()
+        allowance = min(capacity, allowance + (now-last)*rate)
+        last = now
+        if allowance >= 1:
+            allowance -= 1
+            yield item
+
+class DecompressedFile:
+    '''
+    A decompressing reader of fp, which closes fp as well when it is closed.
+    '''
+    def __init__(self, decompressed, fp):
+        super().__init__()
+        self.decompressed = decompressed
+        self.fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self.decompressed, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        try:
+            self.decompressed.close()
+        finally:
+            self.fp.close()
+
+def open_input(path):
+    '''
+    Open path for binary reading. gzip, bz2 and xz files are recognised by
+    their magic number and decompressed as they are read. path is opened only
+    once, so it may be a pipe such as /dev/stdin.
+    '''
+    f = open(path, 'rb')
+    try:
+        head = f.peek(6)
+        for (magic, open_f) in COMPRESSION_MAGIC:
+            if head.startswith(magic):
+                return DecompressedFile(open_f(f), f)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+def expand_paths(patterns):
+    '''
+    Expand the glob patterns into a list of paths, in order. A pattern which
+    matches nothing is kept as is so opening it reports the missing file.
+    '''
+    import glob
+    paths = list()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if len(matches) == 0:
+            matches = [pattern]
+        paths.extend(matches)
+    return paths
+
+def iter_file_spans(paths, unwrap=False, chunk_size=CHUNK_SIZE):
+    '''
+    Yield (path, offset, document) for every document of the files in paths,
+    one file after the other.
+    '''
+    for path in paths:
+        with open_input(path) as f:
+            for (offset, doc) in iter_spans(f, unwrap, chunk_size):
+                yield (path, offset, doc)
+
+def map_files(worker_f, paths, processes=None):
+    '''
+    Run worker_f(path) for every path in a process pool, one shard per file,
+    and yield (path, result) in the order of paths as results complete.
+    worker_f must be a picklable module level function.
+
+    Closing the generator early, e.g. once enough matches were seen, cancels
+    the files which have not been started yet.
+    '''
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(worker_f, path) for path in paths]
+        try:
+            for (path, future) in zip(paths, futures):
+                yield (path, future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+
+def is_replaced(path, f):
+    '''
+    Whether path names a different file than the open file f, e.g. after log
+    rotation.
+    '''
+    try:
+        path_stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    f_stat = os.fstat(f.fileno())
+    return (path_stat.st_dev, path_stat.st_ino) != (f_stat.st_dev, f_stat.st_ino)
+
+def splitter_at(unwrap, offset):
+    '''
+    Return a Splitter for a stream joined at offset between two documents, or
+    between two elements of the top level array when unwrapping.
+    '''
+    splitter = Splitter(unwrap)
+    splitter.offset = offset
+    splitter.depth = splitter.base
+    return splitter
+
+def resync(unwrap, offset, data):
+    '''
+    Split data, found at offset in the stream, from the first line on whose
+    rest splits without error. Returns the Splitter and the documents it
+    completed, or (None, []) if there is no such line.
+    '''
+    idx = data.find(b'\n')
+    while idx >= 0:
+        splitter = splitter_at(unwrap, offset + idx + 1)
+        try:
+            return (splitter, splitter.feed(data[idx+1:]))
+        except ValueError:
+            idx = data.find(b'\n', idx+1)
+    return (None, list())
+
+def skip_history(f, unwrap, chunk_size):
+    '''
+    Skip the content of the open file f. Returns (splitter, guessed) to split
+    what is appended to it from now on, where splitter is None if the bytes
+    up to the next newline must be dropped first, and guessed tells whether
+    the document boundary it starts at is only a guess.
+    '''
+    if unwrap:
+        # Where the elements are depends on the array they are in, so the
+        # file is split from its beginning unless it is malformed.
+        splitter = Splitter(unwrap)
+        try:
+            for data in iter(lambda: f.read(chunk_size), b''):
+                splitter.feed(data)
+            return (splitter, False)
+        except ValueError:
+            pass
+
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return (Splitter(unwrap), False)
+    f.seek(end - 1)
+    if f.read(1) == b'\n':
+        return (splitter_at(unwrap, end), True)
+    return (None, True)
+
+def follow(path, unwrap=False, chunk_size=CHUNK_SIZE, from_start=False):
+    '''
+    Follow the growing file at path, like tail -f, and yield a list of
+    (offset, document) as soon as a read completes documents, so the caller
+    can flush its output once per list. Never returns.
+
+    Like tail -f, only what is appended after the call is read unless
+    from_start is set, and bytes already in the file never end the follow.
+    Splitting then starts at the end of the file if it ends a line, or else
+    at the next newline, so the rest of a document cut by either is dropped.
+    Until a document is found there, a ValueError starts it over at the next
+    newline, in case the guessed boundary was inside a document spanning
+    several lines. With unwrap the elements are only found by splitting the
+    file from its beginning, which is done unless that fails.
+
+    When the file stops growing the wait between reads doubles from
+    FOLLOW_MIN_DELAY up to FOLLOW_MAX_DELAY and is reset by new data. If the
+    file is truncated it is read again from the beginning, and if path is
+    replaced, e.g. by log rotation, the rest of the old file is read before
+    switching to the new one, which is read from its beginning, as is the
+    file at path if it does not exist yet. A document cut short by either is
+    dropped.
+    '''
+    f = None
+    delay = FOLLOW_MIN_DELAY
+    guessed = False
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    from_start = True
+                    time.sleep(delay)
+                    delay = min(2*delay, FOLLOW_MAX_DELAY)
+                    continue
+                (splitter, guessed) = (Splitter(unwrap), False)
+                if not from_start:
+                    (splitter, guessed) = skip_history(f, unwrap, chunk_size)
+                    from_start = True
+
+            data = f.read(chunk_size)
+            if len(data) > 0:
+                delay = FOLLOW_MIN_DELAY
+                if splitter is None:
+                    (splitter, spans) = resync(unwrap,
+                                               f.tell() - len(data),
+                                               data)
+                else:
+                    try:
+                        spans = splitter.feed(data)
+                    except ValueError:
+                        if not guessed:
+                            raise
+                        (splitter, spans) = resync(unwrap,
+                                                   splitter.offset,
+                                                   bytes(splitter.buf))
+                if len(spans) > 0:
+                    guessed = False
+                    yield spans
+
+            elif is_replaced(path, f):
+                f.close()
+                f = None
+
+            elif os.fstat(f.fileno()).st_size < f.tell():
+                f.seek(0)
+                (splitter, guessed) = (Splitter(unwrap), False)
+
+            else:
+                time.sleep(delay)
+                delay = min(2*delay, FOLLOW_MAX_DELAY)
+    finally:
+        if f is not None:
+            f.close()
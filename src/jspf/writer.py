@@ -0,0 +1,151 @@
+import errno
+import os
+import stat
+
+'''
+Batched output of matched documents.
+
+Matched documents are byte spans of the input. The BatchWriter keeps
+references to the spans instead of copying them into one string and hands them
+to the kernel many at a time with os.writev. Spans which are still in the
+input file can be copied file to file without passing through python at all.
+'''
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+FLUSH_BYTES = 1 << 20
+
+# copy_file_range fails with these when the kernel cannot copy between the two
+# files, e.g. across file systems on older kernels or from a special file.
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP}
+
+def write_all(fd, buffers):
+    '''
+    Write all of buffers to fd, using os.writev where available and retrying
+    partial writes.
+    '''
+    buffers = [memoryview(buf) for buf in buffers if len(buf) > 0]
+    if not hasattr(os, 'writev'):
+        data = b''.join(buffers)
+        while len(data) > 0:
+            data = data[os.write(fd, data):]
+        return
+
+    while len(buffers) > 0:
+        n_written = os.writev(fd, buffers[:IOV_MAX])
+        idx = 0
+        while idx < len(buffers) and n_written >= len(buffers[idx]):
+            n_written -= len(buffers[idx])
+            idx += 1
+        del buffers[:idx]
+        if n_written > 0:
+            buffers[0] = buffers[0][n_written:]
+
+def is_append(fd):
+    import fcntl
+    try:
+        return fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_APPEND != 0
+    except OSError:
+        return False
+
+def copy_unsupported(e, out_fd):
+    '''
+    Whether copy_file_range failed with e because it cannot copy to out_fd,
+    rather than because the copy itself failed.
+    '''
+    if e.errno in COPY_FALLBACK_ERRNOS:
+        return True
+    # copy_file_range refuses an out_fd opened with O_APPEND with EBADF.
+    return e.errno == errno.EBADF and is_append(out_fd)
+
+def copy_range(out_fd, in_fd, offset, count):
+    '''
+    Copy count bytes at offset of the file in_fd to out_fd, inside the kernel
+    when the platform allows it. Raises EOFError, without writing anything
+    when in_fd is a regular file, if the range goes beyond its end.
+    '''
+    in_stat = os.fstat(in_fd)
+    if stat.S_ISREG(in_stat.st_mode) and offset + count > in_stat.st_size:
+        raise EOFError('Range beyond the end of the input')
+
+    copy_f = getattr(os, 'copy_file_range', None)
+    while count > 0:
+        n_copied = 0
+        if copy_f is not None:
+            try:
+                n_copied = copy_f(in_fd, out_fd, count, offset)
+            except OSError as e:
+                if not copy_unsupported(e, out_fd):
+                    raise
+                copy_f = None
+        if n_copied == 0:
+            data = os.pread(in_fd, count, offset)
+            if len(data) == 0:
+                raise EOFError('Range beyond the end of the input')
+            write_all(out_fd, [data])
+            n_copied = len(data)
+        offset += n_copied
+        count -= n_copied
+
+class BatchWriter:
+    def __init__(self, fd, separator=b'\n', flush_bytes=FLUSH_BYTES):
+        super().__init__()
+        self.fd = fd
+        self.separator = separator
+        self.flush_bytes = flush_bytes
+        self.buffers = list()
+        self.n_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def write(self, span):
+        '''
+        Queue span, followed by the separator, for output.
+        '''
+        self.buffers.append(span)
+        self.buffers.append(self.separator)
+        self.n_bytes += len(span) + len(self.separator)
+        if self.n_bytes >= self.flush_bytes:
+            self.flush()
+
+    def write_batch(self, spans):
+        for span in spans:
+            self.write(span)
+
+    def write_range(self, in_fd, offset, count):
+        '''
+        Output count bytes at offset of the file in_fd, followed by the
+        separator, after everything queued so far.
+        '''
+        self.flush()
+        copy_range(self.fd, in_fd, offset, count)
+        write_all(self.fd, [self.separator])
+
+    def flush(self):
+        write_all(self.fd, self.buffers)
+        self.buffers = list()
+        self.n_bytes = 0
+
+class OrderedMerge:
+    '''
+    Writes batches of spans numbered 0, 1, 2, ... in order, whatever order
+    parallel workers finish them in.
+    '''
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+        self.next_seq = 0
+        self.pending = dict()
+
+    def put(self, seq, spans):
+        self.pending[seq] = spans
+        while self.next_seq in self.pending:
+            self.writer.write_batch(self.pending.pop(self.next_seq))
+            self.next_seq += 1
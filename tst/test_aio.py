@@ -0,0 +1,52 @@
+import jspf.aio as aio
+import asyncio
+import concurrent.futures
+import json
+import socket
+
+DOCUMENTS = [
+    b'{"foo": {"bar": "123456"}}',
+    b'{"foo": [0, {"bar": "123456"}]}',
+    b'"a string"',
+    b'42',
+    b'[{"bar": {"foo": null}}]',
+]
+
+async def send(writer, data, chunk_size):
+    for i in range(0, len(data), chunk_size):
+        writer.write(data[i:i+chunk_size])
+        await writer.drain()
+        await asyncio.sleep(0)
+    writer.close()
+
+async def collect(agen_f, chunk_size):
+    (rsock, wsock) = socket.socketpair()
+    (reader, reader_writer) = await asyncio.open_connection(sock=rsock)
+    (_, writer) = await asyncio.open_connection(sock=wsock)
+    data = b'\n'.join(DOCUMENTS)
+    sender = asyncio.ensure_future(send(writer, data, chunk_size))
+    result = [doc async for doc in agen_f(reader)]
+    await sender
+    reader_writer.close()
+    return result
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def test_aiter_spans():
+    spans = run(collect(lambda reader: aio.aiter_spans(reader, chunk_size=4), 3))
+    assert [doc for (_, doc) in spans] == DOCUMENTS
+
+def test_aiter_documents():
+    docs = run(collect(aio.aiter_documents, 5))
+    assert docs == [json.loads(doc) for doc in DOCUMENTS]
+
+def test_aiter_documents_executor():
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        docs = run(collect(
+            lambda reader: aio.aiter_documents(reader, executor=executor), 7))
+    assert docs == [json.loads(doc) for doc in DOCUMENTS]
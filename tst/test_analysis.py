@@ -0,0 +1,30 @@
+import jspf.compiler.analysis as analysis
+import jspf.compiler.syntax as syntax
+
+def required_keys(prog):
+    return analysis.required_keys(syntax.pass_syntax(prog))
+
+def test_str_match_text():
+    assert analysis.str_match_text('[foo]') == 'foo'
+    assert analysis.str_match_text(r'[a\]b\\c]') == 'a]b\\c'
+
+def test_required_keys():
+    prog = r'  ^.[foo]./bar\d+/(?!./baz/).(.{7, ..., 15}|.{100, 105, 110})' +\
+           r'(?=./qux/+).*?<.$/^[h-y]+-\d\d$/>'
+    assert required_keys(prog) == {'foo'}
+
+def test_required_keys_sequence():
+    assert required_keys('^.[a].[b]$/x/') == {'a', 'b'}
+    assert required_keys('.[a]+.[b]++.[c]+?.') == {'a', 'b', 'c'}
+
+def test_required_keys_optional():
+    assert required_keys('.[a]?.[b]*.[c]??.[d]*+.') == set()
+    assert required_keys('(.[a].[b])*.[c]') == {'c'}
+
+def test_required_keys_groups():
+    assert required_keys('<.[a]>(.[b])(?=.[c])(?!.[d])') == {'a', 'b', 'c'}
+    assert required_keys('(.[a].[b]|.[a].[c])') == {'a'}
+    assert required_keys('(.[a].[b]|.[b].[a]|.[c].[a].[b])') == {'a', 'b'}
+
+def test_required_keys_values():
+    assert required_keys('.$[a]') == set()
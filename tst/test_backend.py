@@ -0,0 +1,74 @@
+import jspf.backend as backend
+import json
+import pytest
+
+DOCUMENTS = [
+    r'{"foo": {"bar": "123456"}}',
+    r'{"foo": [0, {"bar": "123456"}]}',
+    r'{"foo": {"blahblahblah": {"bar": "123456"}}}',
+    r'{"some_other_root": {"foo": {"bar": "123999"}}}',
+    r'{"some_other_root_with_container": [{"foo": {"bar": "123999"}}]}',
+    r'{"esc\"aped": "tab\there", "unié": "😀"}',
+    r'{"n": [0, -1, 1.5, -2.25e3, 12345678901234, true, false, null]}',
+    r'{"dup": 1, "dup": 2}',
+    r'[[], {}, [[[]]], {"": ""}]',
+    r'"just a string"',
+    r'-0.5',
+    r'null',
+]
+
+# Documents on which the optional backends are known to differ from json.
+EDGE_DOCUMENTS = [
+    r'{"n": 123456789012345678901234567890}',
+    r'[18446744073709551616, -9223372036854775809]',
+    r'[NaN, Infinity, -Infinity]',
+    r'"\ud800"',
+    r'[1e400]',
+]
+
+@pytest.fixture(params=backend.available_backends(), ids=lambda b: b.name)
+def each_backend(request):
+    return request.param
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_conformance_str(each_backend, doc):
+    assert each_backend.loads(doc) == json.loads(doc)
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+def test_conformance_bytes(each_backend, doc):
+    assert each_backend.loads(doc.encode('utf-8')) == json.loads(doc)
+
+@pytest.mark.parametrize('doc', EDGE_DOCUMENTS)
+def test_default_edge_cases(doc):
+    # repr, since NaN is not equal to itself.
+    assert repr(backend.select_backend().loads(doc)) == repr(json.loads(doc))
+    assert repr(backend.select_backend().loads(doc.encode('utf-8'))) == \
+        repr(json.loads(doc))
+
+@pytest.mark.parametrize('doc', EDGE_DOCUMENTS)
+def test_edge_cases(each_backend, doc):
+    # Each backend either agrees with json, rejects the document, or reads
+    # integers beyond 64 bits as floats.
+    expected = json.loads(doc)
+    try:
+        loaded = each_backend.loads(doc)
+    except ValueError:
+        assert each_backend.name != 'json'
+        return
+    if repr(loaded) != repr(expected):
+        assert each_backend.name != 'json'
+        assert json.loads(doc, parse_int=float) == loaded
+
+def test_select_default():
+    assert backend.select_backend().name == 'json'
+
+def test_fastest_backend():
+    selected = backend.fastest_backend()
+    assert selected.name == backend.available_backends()[0].name
+
+def test_select_json():
+    assert backend.select_backend('json').name == 'json'
+
+def test_select_unknown():
+    with pytest.raises(ValueError):
+        backend.select_backend('yaml')
@@ -0,0 +1,183 @@
+import jspf.compiler.cache as cache
+import jspf.compiler.syntax as syntax
+from jspf.compiler.CompilerError import CompilerError
+import concurrent.futures
+import os
+import pytest
+
+PROG = r'  ^.[foo]./bar\d+/(?!./baz/).(.{7, ..., 15}|.{100, 105, 110})' +\
+       r'(?=./qux/+).*?<.$/^[h-y]+-\d\d$/>'
+
+def test_round_trip():
+    tree = syntax.pass_syntax(PROG)
+    data = cache.dumps(tree, PROG)
+    assert cache.loads(data, PROG).to_dict() == tree.to_dict()
+
+def test_round_trip_unicode():
+    prog = r'.[ünï\]cödé].$/😀/'
+    tree = syntax.pass_syntax(prog)
+    assert cache.loads(cache.dumps(tree, prog), prog).to_dict() == \
+        tree.to_dict()
+
+def test_loads_wrong_source():
+    data = cache.dumps(syntax.pass_syntax(PROG), PROG)
+    with pytest.raises(ValueError):
+        cache.loads(data, PROG + '.')
+
+def test_loads_truncated():
+    data = cache.dumps(syntax.pass_syntax(PROG), PROG)
+    for end in [0, cache.HEADER.size, len(data) - 1]:
+        with pytest.raises(ValueError):
+            cache.loads(data[:end], PROG)
+
+def test_loads_wrong_version():
+    data = bytearray(cache.dumps(syntax.pass_syntax(PROG), PROG))
+    data[4] += 1
+    with pytest.raises(ValueError):
+        cache.loads(bytes(data), PROG)
+
+def test_filter_cache(tmp_path, monkeypatch):
+    filter_cache = cache.FilterCache(str(tmp_path / 'jspf'))
+    assert filter_cache.load(PROG) is None
+
+    tree = filter_cache.pass_syntax(PROG)
+    assert filter_cache.load(PROG).to_dict() == tree.to_dict()
+
+    def fail(prog):
+        raise AssertionError('cache hit must not recompile')
+    monkeypatch.setattr(syntax, 'pass_syntax', fail)
+    assert filter_cache.pass_syntax(PROG).to_dict() == tree.to_dict()
+
+def test_filter_cache_corrupt(tmp_path):
+    filter_cache = cache.FilterCache(str(tmp_path))
+    with open(filter_cache.path(), 'wb') as f:
+        f.write(b'JSPF garbage')
+    assert filter_cache.load(PROG) is None
+    tree = filter_cache.pass_syntax(PROG)
+    assert filter_cache.load(PROG).to_dict() == tree.to_dict()
+
+def test_filter_cache_compile_many(tmp_path, monkeypatch):
+    progs = [PROG, r'.[a', r'^.[a].[b]$/x/', PROG]
+    filter_cache = cache.FilterCache(str(tmp_path))
+    results = filter_cache.compile_many(progs)
+    assert results[0] is results[3]
+    assert isinstance(results[1], CompilerError)
+    assert results[2].to_dict() == syntax.pass_syntax(progs[2]).to_dict()
+
+    compiled = list()
+    pass_syntax = syntax.pass_syntax
+    def count(prog):
+        compiled.append(prog)
+        return pass_syntax(prog)
+    monkeypatch.setattr(syntax, 'pass_syntax', count)
+    # A new instance, as in a new process, maps the table stored above.
+    results = cache.FilterCache(str(tmp_path)).compile_many(progs + ['.'])
+    assert compiled == [r'.[a', '.']
+    assert results[0].to_dict() == syntax.pass_syntax(PROG).to_dict()
+    assert cache.FilterCache(str(tmp_path)).load('.') is not None
+
+def first_token(tree):
+    while isinstance(tree, syntax.Tree):
+        tree = tree.subtree[0]
+    return tree
+
+def test_filter_cache_interned(tmp_path):
+    filter_cache = cache.FilterCache(str(tmp_path))
+    # A miss, then a hit, are both interned.
+    for _ in range(2):
+        [tree, again] = filter_cache.compile_many([PROG, PROG + '  '])
+        assert first_token(tree).prog_idx is None
+        assert first_token(tree) is first_token(again)
+
+def test_filter_cache_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'COMPACT_MIN_FILTERS', 4)
+    filter_cache = cache.FilterCache(str(tmp_path))
+    progs = ['.[k{}]'.format(i) for i in range(8)]
+    filter_cache.compile_many(progs[:4])
+    assert not os.path.exists(filter_cache.path())
+    assert os.path.exists(filter_cache.journal_path())
+
+    # The journal outgrows COMPACT_MIN_FILTERS and is merged into the table.
+    filter_cache.pass_syntax(progs[4])
+    assert not os.path.exists(filter_cache.journal_path())
+    table_stat = os.stat(filter_cache.path())
+
+    # Then misses only append to the journal until it outgrows the table.
+    for prog in progs[5:]:
+        filter_cache.pass_syntax(prog)
+    assert os.stat(filter_cache.path()).st_mtime_ns == table_stat.st_mtime_ns
+    other = cache.FilterCache(str(tmp_path))
+    for prog in progs:
+        assert other.load(prog).to_dict() == syntax.pass_syntax(prog).to_dict()
+
+    other.compact()
+    assert not os.path.exists(filter_cache.journal_path())
+    assert other.table.n_filters == len(progs)
+    for prog in progs:
+        assert filter_cache.load(prog).to_dict() == \
+            syntax.pass_syntax(prog).to_dict()
+
+def test_filter_cache_wide_union(tmp_path):
+    # More alternatives in one U node than fit in 16 bits, among ordinary
+    # filters which must not fail with it.
+    n = 100000
+    prog = r'(' + r'|'.join(r'.[k{}]'.format(i) for i in range(n)) + r')'
+    progs = [r'.[a]', prog, r'.[b]']
+    cache.FilterCache(str(tmp_path)).compile_many(progs)
+    [a_tree, tree, b_tree] = cache.FilterCache(str(tmp_path)).compile_many(progs)
+    assert a_tree.to_dict() == syntax.pass_syntax(r'.[a]').to_dict()
+    assert b_tree.to_dict() == syntax.pass_syntax(r'.[b]').to_dict()
+    u_tree = tree.subtree[0].subtree[2]
+    assert u_tree.node_type == syntax.Node.U
+    assert len(u_tree.subtree) == 2 * (n-1)
+    assert u_tree.subtree[-1].subtree[0].subtree[1].subtree[0].lexeme == \
+        r'[k{}]'.format(n-1)
+
+def test_filter_cache_threads(tmp_path):
+    filter_cache = cache.FilterCache(str(tmp_path))
+    progs = [PROG, r'^.[a].[b]$/x/', r'./foo/.*./bar/$/123.*/'] * 30
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        trees = list(executor.map(filter_cache.pass_syntax, progs))
+    for (prog, tree) in zip(progs, trees):
+        assert tree.to_dict() == syntax.pass_syntax(prog).to_dict()
+        assert filter_cache.load(prog).to_dict() == tree.to_dict()
+
+def test_dumps_many():
+    progs = [PROG, '.[a]', '..[a]', r'.$/x/.[a]']
+    data = cache.dumps_many(zip(progs, map(syntax.pass_syntax, progs)))
+    table = cache.Table(data)
+    trees = [table.load(prog) for prog in progs]
+    for (prog, tree) in zip(progs, trees):
+        assert tree.to_dict() == syntax.pass_syntax(prog).to_dict()
+    # The ".[a]" step is stored and loaded once.
+    assert trees[1].subtree[0] is trees[2].subtree[2].subtree[0]
+    assert table.load(PROG + '.') is None
+    assert len(data) < sum(len(cache.dumps(syntax.pass_syntax(prog), prog))
+                           for prog in progs)
+
+def test_loads_malformed():
+    data = bytearray(cache.dumps(syntax.pass_syntax('.[a]'), '.[a]'))
+    # Make the root its own child.
+    table = cache.Table(bytes(data))
+    n_nodes = table.n_nodes
+    offset = table.nodes_offset + table.nodes_size - cache.CHILD.size
+    data[offset:offset+cache.CHILD.size] = cache.CHILD.pack(n_nodes - 1)
+    with pytest.raises(ValueError):
+        cache.loads(bytes(data), '.[a]')
+    with pytest.raises(ValueError):
+        cache.Table(bytes(data)).decode_all()
+
+def test_decode_all():
+    progs = [PROG, '.[a]', '..[a]', r'.$/x/.[a]']
+    data = cache.dumps_many(zip(progs, map(syntax.pass_syntax, progs)))
+    (lazy, bulk) = (cache.Table(data), cache.Table(data))
+    bulk.decode_all()
+    assert None not in bulk.nodes
+    for prog in progs:
+        assert bulk.load(prog).to_dict() == lazy.load(prog).to_dict()
+
+def test_round_trip_interned():
+    progs = ['.[a]', '..[a]', r'.$/x/.[a]', PROG]
+    for (prog, tree) in zip(progs, syntax.compile_many(progs)):
+        loaded = cache.loads(cache.dumps(tree, prog), prog)
+        assert loaded.to_dict() == syntax.pass_syntax(prog).to_dict()
@@ -0,0 +1,76 @@
+import jspf.compiler.analysis as analysis
+import jspf.compiler.cache as cache
+import jspf.compiler.lexer as lexer
+import jspf.compiler.syntax as syntax
+from jspf.compiler.CompilerError import CompilerError
+import functools
+import pytest
+import time
+
+# Filters are user supplied, so compile time must stay linear in the length of
+# the filter and no shape of filter may raise RecursionError.
+
+# RecursionError used to show up at about 1000 steps, and a union of more
+# than 65535 alternatives overflowed a 16 bit count.
+SIZES = [10, 100, 1000, 10000, 100000]
+
+# Timing is compared on sizes small enough to measure a few times.
+LINEAR_SIZES = (1000, 10000)
+
+STEPS = [r'.[foo]', r'./bar\d+/', r'.{1, ..., 3}*']
+
+@functools.lru_cache()
+def steps(n):
+    return r'^' + ''.join(STEPS[i % len(STEPS)] for i in range(n-1)) + r'$/x/'
+
+@functools.lru_cache()
+def union(n):
+    return r'(' + r'|'.join(r'.[k{}]'.format(i) for i in range(n)) + r')'
+
+def nested(n):
+    return r'(' * n + r'.' + r')' * n
+
+def nested_union(n):
+    return r'(.|' * n + r'.' + r')' * n
+
+def elapsed(f, prog):
+    start = time.perf_counter()
+    f(prog)
+    return time.perf_counter() - start
+
+@pytest.mark.parametrize('make_prog', [steps, union])
+def test_linear(make_prog):
+    for f in [lexer.pass_lexer, syntax.pass_syntax]:
+        (small_n, large_n) = LINEAR_SIZES
+        small = min(elapsed(f, make_prog(small_n)) for _ in range(3))
+        large = min(elapsed(f, make_prog(large_n)) for _ in range(3))
+        # 10 times the input, allowing generous noise but not quadratic growth.
+        assert large < 30 * small
+
+@pytest.mark.parametrize('make_prog', [steps, union])
+@pytest.mark.parametrize('n', SIZES)
+def test_no_recursion_error(make_prog, n):
+    prog = make_prog(n)
+    tree = syntax.pass_syntax(prog)
+    tree.to_dict()
+    analysis.required_keys(tree)
+    data = cache.dumps(tree, prog)
+    assert cache.dumps(cache.loads(data, prog), prog) == data
+    syntax.Interner().intern(tree)
+
+@pytest.mark.parametrize('make_prog', [nested, nested_union])
+def test_nesting_limit(make_prog):
+    syntax.pass_syntax(make_prog(syntax.MAX_NESTING - 1)).to_dict()
+    for n in [syntax.MAX_NESTING, 10000]:
+        with pytest.raises(CompilerError):
+            syntax.pass_syntax(make_prog(n))
+
+@pytest.mark.parametrize('prog', [r'/' + 'a' * 100000,
+                                  r'[' + '\\]' * 100000,
+                                  r'(' * 100000,
+                                  r')' * 100000,
+                                  r'<' * 100000 + r'.'],
+                         ids=['regex', 'str_match', 'open', 'close', 'select'])
+def test_adversarial(prog):
+    with pytest.raises(CompilerError):
+        syntax.pass_syntax(prog)
@@ -0,0 +1,63 @@
+import jspf.compiler.explain as explain
+import jspf.compiler.syntax as syntax
+import jspf.__main__ as main
+
+def max_depth(prog):
+    return explain.depth(syntax.pass_syntax(prog))[1]
+
+def cost(prog):
+    return explain.cost_class(syntax.pass_syntax(prog))
+
+def test_explain():
+    report = explain.explain(r' ^.[a] .[b]$/x/ ')
+    assert report == {
+        'filter': r'^.[a].[b]$/x/',
+        'structure': [r'^', r'.[a]', r'.[b]', r'$/x/'],
+        'tokens': 7,
+        'nodes': 28,
+        'required_keys': ['a', 'b'],
+        'max_depth': 2,
+        'cost': 'linear',
+    }
+
+def test_structure():
+    tree = syntax.pass_syntax(r'.(.[a]|.[b])*(?!./c/)<.$>')
+    assert explain.structure(tree) == [
+        r'.',
+        r'(',
+        r'  .[a]',
+        r'|',
+        r'  .[b]',
+        r')*',
+        r'(?!',
+        r'  ./c/',
+        r')',
+        r'<',
+        r'  .',
+        r'  $',
+        r'>']
+
+def test_max_depth():
+    assert max_depth(r'^$') == 0
+    assert max_depth(r'.[a].?.') == 3
+    assert max_depth(r'(.|..)..') == 4
+    assert max_depth(r'.(?=...).') == 4
+    assert max_depth(r'.(?=.)..') == 3
+    assert max_depth(r'.*') is None
+    assert max_depth(r'(.$)+') is None
+    assert max_depth(r'($)*.') == 1
+
+def test_cost_class():
+    assert cost(r'./foo/.*./bar/$/123.*/') == 'linear'
+    assert cost(r'(.[a]|.[b])') == 'linear'
+    assert cost(r'(.[a]|.[b])+') == 'backtracking-bounded'
+    assert cost(r'.((?!.[a]).)') == 'backtracking-bounded'
+
+def test_main(capsys):
+    assert main.main(['--explain', r'^.[a].[b]$/x/']) == 0
+    assert 'required keys: \'a\', \'b\'' in capsys.readouterr().out
+    assert main.main(['--explain', r'(.']) == 2
+    assert 'Unexpected end of filter' in capsys.readouterr().err
+    for prog in [r'./(/', r'.{5, 1}']:
+        assert main.main(['--explain', prog]) == 2
+        assert capsys.readouterr().err.startswith('jspf: ')
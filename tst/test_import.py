@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+# jspf is started from shell pipelines and cron scripts, so importing it must
+# stay cheap: optional backends and heavy stdlib modules are only imported
+# when they are used.
+
+MODULES = ['jspf.__main__',
+           'jspf.backend',
+           'jspf.index',
+           'jspf.stream',
+           'jspf.writer',
+           'jspf.compiler.cache',
+           'jspf.compiler.explain',
+           'jspf.compiler.literal',
+           'jspf.compiler.syntax']
+
+LAZY_MODULES = ['orjson',
+                'simdjson',
+                'ujson',
+                'numpy',
+                'asyncio',
+                'multiprocessing',
+                'concurrent.futures',
+                'tempfile',
+                'hashlib',
+                'glob',
+                'gzip',
+                'bz2',
+                'lzma',
+                'json']
+
+# The stdlib modules which each module cannot do without, and which are
+# imported for it.
+REQUIRED_MODULES = {
+    'jspf.compiler.syntax': ['enum', 're'],
+    'jspf.compiler.literal': ['enum', 're', 'math', 'bisect'],
+    'jspf.stream': ['re'],
+    'jspf.__main__': ['enum', 're', 'argparse'],
+}
+
+# Import time of a module, counting every module imported for it. This is
+# about 7 to 11 ms, most of it in enum and re.
+BUDGET_US = 20000
+# Import time of a module beyond that of its REQUIRED_MODULES, which is the
+# time spent in jspf itself and in modules imported by mistake. This is about
+# 1 to 3 ms; tempfile alone adds 4 ms and asyncio 35 ms.
+OVERHEAD_BUDGET_US = 5000
+
+def run(code, *args, env_update=None):
+    env = dict(os.environ)
+    env.update(env_update or dict())
+    src_path = os.path.join(os.path.dirname(__file__), '..', 'src')
+    env['PYTHONPATH'] = os.pathsep.join([src_path, env.get('PYTHONPATH', '')])
+    return subprocess.run([sys.executable] + list(args) + ['-c', code],
+                          env=env,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True)
+
+def test_lazy_modules():
+    code = 'import sys\n'
+    code += ''.join('import {}\n'.format(m) for m in MODULES)
+    code += 'print(" ".join(m for m in {!r} if m in sys.modules))'.format(
+        LAZY_MODULES)
+    assert run(code).stdout.split() == []
+
+def import_code(modules):
+    code = 'import sys\nsys.stderr.write("start\\n")\n'
+    return code + ''.join('import {}\n'.format(m) for m in modules)
+
+def import_time_us(code, pycache):
+    '''
+    Return the time in microseconds the imports of code take in a fresh
+    interpreter, including every module imported for them, with bytecode
+    cached in pycache.
+    '''
+    stderr = run(code,
+                 '-X', 'importtime',
+                 '-X', 'pycache_prefix=' + pycache,
+                 env_update={'PYTHONDONTWRITEBYTECODE': ''}).stderr
+    lines = stderr.splitlines()
+    total_us = 0
+    for line in lines[lines.index('start')+1:]:
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        (_, cumulative_us, name) = line[len('import time:'):].split('|')
+        # Modules imported by other modules are part of their cumulative
+        # time, so only the outermost imports count.
+        if not name.startswith('  '):
+            total_us += int(cumulative_us)
+    return total_us
+
+def test_import_time(tmp_path):
+    pycache = str(tmp_path)
+    for (module, required) in REQUIRED_MODULES.items():
+        codes = [import_code([module]), import_code(required)]
+        # The first run only fills the bytecode cache. Runs alternate so that
+        # both see the same load of the machine.
+        times = [[import_time_us(code, pycache) for code in codes]
+                 for _ in range(8)]
+        (total_us, required_us) = [min(ts) for ts in zip(*times[1:])]
+        assert total_us < BUDGET_US, module
+        assert total_us - required_us < OVERHEAD_BUDGET_US, module
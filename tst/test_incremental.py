@@ -0,0 +1,151 @@
+from jspf.compiler.incremental import IncrementalCompiler
+import jspf.compiler.lexer as lexer
+import jspf.compiler.syntax as syntax
+from jspf.compiler.CompilerError import CompilerError
+import pytest
+import random
+import time
+
+def walk(tree):
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        yield node
+        if isinstance(node, syntax.Tree):
+            stack.extend(node.subtree)
+
+def find_lookahead(tree):
+    for node in walk(tree):
+        if isinstance(node, syntax.Tree) and len(node.subtree) > 0 and \
+                isinstance(node.subtree[0], lexer.Token) and \
+                node.subtree[0].token_type == lexer.TokenType.NONCAP_POS_BEGIN:
+            return node
+
+def check(compiler, prog):
+    tree = compiler.update(prog)
+    assert tree.to_dict() == syntax.pass_syntax(prog).to_dict()
+    tokens = lexer.pass_lexer(prog)
+    assert [(t.token_type, t.lexeme, t.prog_idx)
+            for t in compiler.positioned_tokens()] == \
+        [(t.token_type, t.lexeme, t.prog_idx) for t in tokens]
+    return tree
+
+def test_edit_sequence():
+    compiler = IncrementalCompiler()
+    edits = [
+        '.',
+        '.[foo]',
+        '.[foo].',
+        '.[foo]./bar/',
+        '.[foo]./bar/*',
+        '.[foo]./bar/*?',
+        '(.[foo]./bar/*?)',
+        '(.[foo]|./bar/*?)',
+        '(?=.[foo]|./bar/*?)',
+        '(?!.[foo]|./bar/*?)<.$/x/>',
+        '(?!.[foo]|./bar/*?)  <.$/x/>',
+        '(?!.[f)oo]|./bar/*?)  <.$/x/>',
+        '(?!.[foo]|./b(ar/*?)  <.$/x/>',
+        '(.[foo]|./bar/*?)(.{1, 2}|.)',
+        '.{1, 2}',
+        '.[x].{1, 2}',
+        '.[x].[y].{1, 2}',
+        '.[y].{1, 2}',
+        '.{1, 2}.[y]',
+        '(.{1, 2}).[y]',
+        '(.{1, 2}) .[y]',
+        '.[y]',
+        '^',
+    ]
+    for prog in edits:
+        check(compiler, prog)
+
+def test_reuse():
+    compiler = IncrementalCompiler()
+    before = compiler.update('.[foo].[bar](?=./baz/+).[qux]')
+    unchanged = before.subtree[0]
+    after = check(compiler, '.[foo].[bar](?=./baz/+).[quux]')
+    assert after.subtree[0] is unchanged
+    lookahead = find_lookahead(before)
+    assert find_lookahead(after) is lookahead
+    assert all(node not in compiler.fresh for node in walk(lookahead))
+    assert len(compiler.fresh) < sum(1 for _ in walk(after))
+
+def test_relex_only_edit():
+    compiler = IncrementalCompiler()
+    compiler.update('.[a].[b].[c].[d]')
+    old_tokens = list(compiler.tokens)
+    check(compiler, '.[a].[x].[c].[d]')
+    assert compiler.tokens[:2] == old_tokens[:2]
+    assert compiler.tokens[3].lexeme == '[x]'
+    assert compiler.tokens[4:] == old_tokens[4:]
+    check(compiler, '.[a].[xy].[c].[d]')
+    assert compiler.tokens[4:] == old_tokens[4:]
+
+def test_invalid_keeps_state():
+    compiler = IncrementalCompiler()
+    tree = compiler.update('(.[foo])')
+    for prog in ['(.[foo]', '(.[foo]))', '(.[fo']:
+        with pytest.raises(CompilerError):
+            compiler.update(prog)
+        assert compiler.tree is tree
+        assert compiler.prog == '(.[foo])'
+    check(compiler, '(.[foo]).')
+
+def test_fresh():
+    compiler = IncrementalCompiler()
+    compiler.update('.[a].[b]')
+    compiler.update('.[a].[c]')
+    assert {str(tree) for tree in compiler.fresh if tree.node_type ==
+            syntax.Node.C} == {str(syntax.pass_syntax('.[c]').subtree[0]
+                                   .subtree[1])}
+    # Going back to an earlier filter builds no new subtree.
+    compiler.update('.[a].[b]')
+    assert compiler.fresh == []
+
+def test_update_cheaper_than_compile():
+    prog = ''.join('.[key{}](?=./v{}/|.$[x]).*'.format(i, i)
+                   for i in range(300))
+    compiler = IncrementalCompiler()
+    compiler.update(prog)
+    keys = [i for i in range(len(prog)) if prog.startswith('[key', i)]
+    edits = [prog[:i+1] + 'z' + prog[i+1:] for i in keys[::20]]
+    (compile_time, update_time) = (float('inf'), float('inf'))
+    for _ in range(3):
+        start = time.perf_counter()
+        for edit in edits:
+            syntax.pass_syntax(edit)
+        compile_time = min(compile_time, time.perf_counter() - start)
+        start = time.perf_counter()
+        for edit in edits:
+            compiler.update(edit)
+            compiler.update(prog)
+        update_time = min(update_time, (time.perf_counter() - start) / 2)
+    assert compiler.interner.intern(syntax.pass_syntax(prog)) is compiler.tree
+    assert update_time < compile_time / 2
+
+def test_random_edits():
+    rng = random.Random(0)
+    alphabet = '.$^[]/(){}<>|?*+=!a1 \\'
+    compiler = IncrementalCompiler()
+    prog = r'.[a](?=./b/|.$[c]).*<.$/d/>(.{1, 2})'
+    for _ in range(2000):
+        idx = rng.randrange(len(prog) + 1)
+        if rng.random() < 0.3 and idx < len(prog):
+            edit = prog[:idx] + prog[idx+rng.randrange(1, 3):]
+        else:
+            edit = prog[:idx] + rng.choice(alphabet) + prog[idx:]
+        try:
+            expected = syntax.pass_syntax(edit)
+        except CompilerError as e:
+            with pytest.raises(CompilerError) as excinfo:
+                compiler.update(edit)
+            assert str(excinfo.value) == str(e)
+            continue
+        tree = compiler.update(edit)
+        assert compiler.interner.intern(expected) is tree
+        assert [(t.token_type, t.prog_idx)
+                for t in compiler.positioned_tokens()] == \
+            [(t.token_type, t.prog_idx) for t in lexer.pass_lexer(edit)]
+        if len(edit) > 0 and len(edit) < 200:
+            prog = edit
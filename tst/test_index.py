@@ -0,0 +1,70 @@
+import jspf.index as index
+import jspf.compiler.syntax as syntax
+import os
+import pytest
+
+CORPUS = [
+    b'{"foo": {"bar": "123456"}}',
+    b'{"foo": [0, {"bar": "123456"}]}',
+    b'{"baz": 1}',
+    b'[{"bar": {"foo": null}}, {"\\u00fcn\\u00efc\\u00f6d\\u00e9": 2}]',
+    b'"bar"',
+    b'{"foo": 1, "qux": 2}',
+]
+
+@pytest.fixture
+def corpus(tmp_path):
+    corpus_path = str(tmp_path / 'corpus.json')
+    index_path = str(tmp_path / 'corpus.jspi')
+    with open(corpus_path, 'wb') as f:
+        f.write(b'\n'.join(CORPUS) + b'\n')
+    index.build(corpus_path, index_path)
+    return (corpus_path, index_path)
+
+def test_postings(corpus):
+    (_, index_path) = corpus
+    with index.Index(index_path) as idx:
+        assert idx.n_docs == len(CORPUS)
+        assert list(idx.postings('foo')) == [0, 1, 3, 5]
+        assert list(idx.postings('bar')) == [0, 1, 3]
+        assert list(idx.postings('ünïcödé')) == [3]
+        assert list(idx.postings('missing')) == []
+
+def test_candidates(corpus):
+    (_, index_path) = corpus
+    with index.Index(index_path) as idx:
+        assert list(idx.candidates(syntax.pass_syntax('.[foo].*.[bar]'))) == \
+            [0, 1, 3]
+        assert list(idx.candidates(syntax.pass_syntax('.[qux].[foo]'))) == [5]
+        assert list(idx.candidates(syntax.pass_syntax('.[baz]?'))) == \
+            list(range(len(CORPUS)))
+
+def test_query(corpus):
+    (corpus_path, index_path) = corpus
+    docs = [doc for (_, doc) in index.query(corpus_path,
+                                            index_path,
+                                            './foo/.*.[bar]$/123.*/')]
+    assert docs == [CORPUS[0], CORPUS[1], CORPUS[3]]
+
+def test_bad_index(tmp_path):
+    index_path = str(tmp_path / 'bad.jspi')
+    with open(index_path, 'wb') as f:
+        f.write(b'\0' * index.HEADER.size)
+    with pytest.raises(ValueError):
+        index.Index(index_path)
+
+def test_query_changed_corpus(corpus):
+    (corpus_path, index_path) = corpus
+    with open(corpus_path, 'ab') as f:
+        f.write(b'{"foo": {"bar": "123"}}\n')
+    with pytest.raises(ValueError):
+        list(index.query(corpus_path, index_path, '.[foo]'))
+
+    # Rebuilt, then rewritten in place with the same size.
+    index.build(corpus_path, index_path)
+    stat = os.stat(corpus_path)
+    with open(corpus_path, 'r+b') as f:
+        f.write(b'{"qux"')
+    os.utime(corpus_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    with pytest.raises(ValueError):
+        list(index.query(corpus_path, index_path, '.[foo]'))
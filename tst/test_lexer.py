@@ -152,3 +152,12 @@ def test_pass_lexer():
         lexer.TokenType.REGEX,
         lexer.TokenType.SELECT_END]
     assert list(map(lambda t: t.token_type, lexer.pass_lexer(prog))) == tokens
+
+def test_quantifier_at_end():
+    for (prog, token_type) in [('.*?', lexer.TokenType.LAZY_ANY),
+                               ('.++', lexer.TokenType.GREEDY_EXIST),
+                               ('.??', lexer.TokenType.LAZY_OPTIONAL),
+                               ('.*', lexer.TokenType.DEFAULT_ANY)]:
+        assert lexer.pass_lexer(prog)[-1].token_type == token_type
+    assert lexer.pass_lexer('(?=.)')[0].token_type == \
+        lexer.TokenType.NONCAP_POS_BEGIN
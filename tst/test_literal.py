@@ -0,0 +1,130 @@
+import jspf.compiler.literal as literal
+import jspf.compiler.syntax as syntax
+from jspf.compiler.CompilerError import CompilerError
+import json
+import pytest
+import sys
+
+def raw(text):
+    return json.dumps(text)[1:-1].encode('ascii')
+
+def test_str_literal():
+    foo = literal.StrLiteral(r'[foo]')
+    assert foo.matches_raw(b'foo')
+    assert foo.matches_raw(b'f\\u006fo')
+    assert not foo.matches_raw(b'fo')
+    assert not foo.matches_raw(b'foo\\n')
+
+def test_str_literal_escapes():
+    quoted = literal.StrLiteral(r'[a"b\]c]')
+    assert quoted.text == 'a"b]c'
+    assert quoted.matches_raw(b'a\\"b]c')
+    assert quoted.matches_raw(b'a\\u0022b]c')
+
+    unicode = literal.StrLiteral(r'[ünï]')
+    assert unicode.matches_raw('ünï'.encode('utf-8'))
+    assert unicode.matches_raw(raw('ünï'))
+
+def test_regex_literal():
+    regex = literal.RegexLiteral(r'/^[h-y]+-\d\d$/')
+    (pattern, subject) = regex.for_raw(b'holly-42')
+    assert subject == b'holly-42'
+    assert pattern.search(subject)
+
+    (pattern, subject) = regex.for_raw(b'holly\\u002d42')
+    assert subject == 'holly-42'
+    assert pattern.search(subject)
+
+def test_regex_literal_unicode():
+    # \w and \d only agree between bytes and str patterns on ASCII subjects.
+    regex = literal.RegexLiteral(r'/^\w+$/')
+    for text in ['abc', 'ünï', 'a b']:
+        (pattern, subject) = regex.for_raw(text.encode('utf-8'))
+        assert bool(pattern.search(subject)) == bool(regex.str_re.search(text))
+
+    regex = literal.RegexLiteral(r'/ü/')
+    assert regex.bytes_re is None
+    (pattern, subject) = regex.for_raw('ü'.encode('utf-8'))
+    assert pattern.search(subject)
+
+def test_regex_literal_slash():
+    regex = literal.RegexLiteral(r'/a\/b/')
+    (pattern, subject) = regex.for_raw(b'a/b')
+    assert pattern.search(subject)
+
+def test_regex_literal_str_escapes():
+    for (lexeme, text) in [(r'/\U0001F600/', '😀'),
+                           (r'/\u00fc/', 'ü'),
+                           (r'/\N{SNOWMAN}/', '☃')]:
+        regex = literal.RegexLiteral(lexeme)
+        assert regex.bytes_re is None
+        for subject in [raw(text), literal.encode_raw(text)]:
+            (pattern, decoded) = regex.for_raw(subject)
+            assert pattern.search(decoded)
+
+@pytest.mark.parametrize('prog', [r'./(/', r'^/+,=/', r'.[a]$/[/'])
+def test_regex_literal_invalid(prog):
+    with pytest.raises(CompilerError):
+        literal.literals(syntax.pass_syntax(prog))
+
+def test_literals():
+    tree = syntax.pass_syntax(r'.[a]./x/.[a](.[b]|./x/).{1, 2}$/y/')
+    literals = literal.literals(tree)
+    assert sorted(literals.keys()) == \
+        [r'/x/', r'/y/', r'[a]', r'[b]', r'{1, 2}']
+    assert isinstance(literals[r'{1, 2}'], literal.IntervalLiteral)
+    assert isinstance(literals[r'[a]'], literal.StrLiteral)
+    assert isinstance(literals[r'/x/'], literal.RegexLiteral)
+
+def test_key_prefilter():
+    prefilter = literal.KeyPrefilter(syntax.pass_syntax(r'.[foo].*.[bar]$'))
+    assert prefilter.may_match(b'{"foo": {"x": {"bar": 1}}}')
+    assert not prefilter.may_match(b'{"foo": {"x": {"baz": 1}}}')
+    assert prefilter.may_match(b'{"foo": {"x": {"b\\u0061r": 1}}}')
+
+    prefilter = literal.KeyPrefilter(syntax.pass_syntax(r'.[ünï]'))
+    assert prefilter.may_match('{"ünï": 1}'.encode('utf-8'))
+    assert not prefilter.may_match(b'{"uni": 1}')
+
+def test_interval_literal():
+    interval = literal.IntervalLiteral(r'{-5, ..., 5, 10, 15, ...}')
+    numbers = [-6, -5, 0, 5, 5.5, 10, 11, 14.9, 15, 1e300]
+    expected = [False, True, True, True, False, True, False, False, True, True]
+    assert list(map(interval.contains, numbers)) == expected
+    assert interval.contains_many(numbers) == expected
+
+def test_interval_literal_unbounded():
+    interval = literal.IntervalLiteral(r'{..., 0.5}')
+    assert interval.contains_many([-1e9, 0.5, 0.6]) == [True, True, False]
+    interval = literal.IntervalLiteral(r'{ ... }')
+    assert interval.contains_many([-1e9, 0, 1e9]) == [True, True, True]
+
+BIG = 1700000000000000001
+BIG_NUMBERS = [BIG - 1, BIG, BIG + 1, float(BIG), 2**53, 2**53 + 1, -1, 0.5]
+
+def check_big_intervals():
+    for lexeme in [r'{1700000000000000001}',
+                   r'{1700000000000000001, ...}',
+                   r'{..., 9007199254740992}',
+                   r'{-1, 0.5}']:
+        interval = literal.IntervalLiteral(lexeme)
+        assert interval.contains_many(BIG_NUMBERS) == \
+            list(map(interval.contains, BIG_NUMBERS))
+    interval = literal.IntervalLiteral(r'{1700000000000000001}')
+    assert interval.contains_many([BIG - 1, BIG]) == [False, True]
+
+def test_interval_literal_big_numbers(monkeypatch):
+    # Without NumPy, whether it is installed or not.
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    check_big_intervals()
+
+def test_interval_literal_big_numbers_numpy():
+    pytest.importorskip('numpy')
+    check_big_intervals()
+
+def test_interval_literal_invalid():
+    for lexeme in [r'{}', r'{a}', r'{5, 1}', r'{1, ..., 3, 2}', r'{..., ...}',
+                   r'{nan}', r'{inf}', r'{-Infinity, ..., 0}', r'{1_000}',
+                   r'{1e400}']:
+        with pytest.raises(CompilerError):
+            literal.IntervalLiteral(lexeme)
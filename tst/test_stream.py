@@ -0,0 +1,282 @@
+import jspf.stream as stream
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import pytest
+import threading
+import time
+
+DOCUMENTS = [
+    b'{"foo": {"bar": "123456"}}',
+    b'{"foo": [0, {"bar": "123456"}]}',
+    b'{"br]ack}ets": "in \\"strings\\" [{"}',
+    b'[1, [2, [3]], {"4": {}}]',
+    b'"a string with \\\\ and \\" inside"',
+    b'-12.5e3',
+    b'true',
+    b'null',
+    b'{}',
+]
+
+def split(data, chunk_size, unwrap=False):
+    splitter = stream.Splitter(unwrap)
+    spans = list()
+    for i in range(0, len(data), chunk_size):
+        spans.extend(splitter.feed(data[i:i+chunk_size]))
+    spans.extend(splitter.close())
+    return spans
+
+def test_split_documents():
+    data = b'  ' + b' \n\t'.join(DOCUMENTS) + b'\n'
+    for chunk_size in range(1, len(data) + 1):
+        spans = split(data, chunk_size)
+        assert [doc for (_, doc) in spans] == DOCUMENTS
+        assert all(data[offset:offset+len(doc)] == doc
+                   for (offset, doc) in spans)
+
+def test_split_unwrap():
+    data = b' [' + b', '.join(DOCUMENTS) + b'] [ 1,2 ]'
+    for chunk_size in range(1, len(data) + 1):
+        spans = split(data, chunk_size, True)
+        assert [doc for (_, doc) in spans] == DOCUMENTS + [b'1', b'2']
+        assert all(data[offset:offset+len(doc)] == doc
+                   for (offset, doc) in spans)
+
+def test_split_unwrap_bounded_buffer():
+    splitter = stream.Splitter(True)
+    record = b'{"k": [' + b'1, ' * 100 + b'2]}'
+    splitter.feed(b'[')
+    for i in range(1000):
+        assert splitter.feed(record + b',') == [(1 + i*(len(record)+1), record)]
+        assert len(splitter.buf) <= len(record)
+
+def test_split_long_string():
+    string = b'"' + b'x\\"' * (3 << 20) + b'"'
+    document = b'{"k": ' + string + b'}'
+    for (data, unwrap, documents) in [
+            (string + b' 1', False, [string, b'1']),
+            (document + b' 1', False, [document, b'1']),
+            (b'[1, ' + string + b']', True, [b'1', string])]:
+        start = time.monotonic()
+        spans = split(data, stream.CHUNK_SIZE, unwrap)
+        # Rescanning the open string on every chunk takes tens of seconds.
+        assert time.monotonic() - start < 5
+        assert [doc for (_, doc) in spans] == documents
+
+@pytest.mark.parametrize('data', [b'{"a": 1', b'"abc', b'[1, 2', b'}', b'1, 2'])
+def test_split_invalid(data):
+    with pytest.raises(ValueError):
+        split(data, 1)
+
+@pytest.mark.parametrize('data', [b'{"a": 1}', b'1', b'[1] {}'])
+def test_split_unwrap_invalid(data):
+    with pytest.raises(ValueError):
+        split(data, 1, True)
+
+def test_iter_documents():
+    data = b'\n'.join(DOCUMENTS)
+    docs = list(stream.iter_documents(io.BytesIO(data), chunk_size=7))
+    assert docs == [json.loads(doc) for doc in DOCUMENTS]
+
+def write_corpus(tmp_path):
+    data = b'\n'.join(DOCUMENTS)
+    paths = list()
+    for (ext, open_f) in [('', open),
+                          ('.gz', gzip.open),
+                          ('.bz2', bz2.open),
+                          ('.xz', lzma.open)]:
+        path = str(tmp_path / ('corpus.json' + ext))
+        with open_f(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+def count_documents(path):
+    with stream.open_input(path) as f:
+        return sum(1 for _ in stream.iter_spans(f))
+
+def test_open_input(tmp_path):
+    for path in write_corpus(tmp_path):
+        with stream.open_input(path) as f:
+            assert f.read() == b'\n'.join(DOCUMENTS)
+
+@pytest.mark.skipif(not os.path.exists('/dev/fd'), reason='needs /dev/fd')
+@pytest.mark.parametrize('compress_f', [lambda data: data,
+                                        gzip.compress,
+                                        bz2.compress,
+                                        lzma.compress])
+def test_open_input_pipe(compress_f):
+    data = b'\n'.join(DOCUMENTS)
+    (read_fd, write_fd) = os.pipe()
+    try:
+        with os.fdopen(write_fd, 'wb') as f:
+            f.write(compress_f(data))
+        with stream.open_input('/dev/fd/{}'.format(read_fd)) as f:
+            assert f.read() == data
+        assert f.closed
+        if isinstance(f, stream.DecompressedFile):
+            assert f.fp.closed
+    finally:
+        os.close(read_fd)
+
+def test_expand_paths(tmp_path):
+    paths = write_corpus(tmp_path)
+    missing = str(tmp_path / 'missing.json')
+    assert stream.expand_paths([str(tmp_path / 'corpus.json*'), missing]) == \
+        sorted(paths) + [missing]
+
+def test_iter_file_spans(tmp_path):
+    paths = write_corpus(tmp_path)
+    spans = list(stream.iter_file_spans(paths))
+    assert [doc for (_, _, doc) in spans] == DOCUMENTS * len(paths)
+    assert [path for (path, _, _) in spans] == \
+        [path for path in paths for _ in DOCUMENTS]
+
+def test_map_files(tmp_path):
+    paths = write_corpus(tmp_path)
+    assert list(stream.map_files(count_documents, paths, 2)) == \
+        [(path, len(DOCUMENTS)) for path in paths]
+
+def sleep_and_count(path):
+    time.sleep(0.2)
+    return count_documents(path)
+
+def test_map_files_early_exit(tmp_path):
+    paths = write_corpus(tmp_path) * 10
+    start = time.time()
+    results = stream.map_files(sleep_and_count, paths, 1)
+    assert next(results) == (paths[0], len(DOCUMENTS))
+    results.close()
+    assert time.time() - start < 0.2 * len(paths) / 2
+
+def write_later(path, data, mode='ab'):
+    def write():
+        time.sleep(0.05)
+        with open(path, mode) as f:
+            f.write(data)
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+def test_follow(tmp_path):
+    path = str(tmp_path / 'log.json')
+    with open(path, 'wb') as f:
+        f.write(b'{"a": 1}\n{"b":')
+    docs = stream.follow(path, from_start=True)
+    assert next(docs) == [(0, b'{"a": 1}')]
+
+    # The rest of a document arrives later.
+    thread = write_later(path, b' 2}\n')
+    assert next(docs) == [(9, b'{"b": 2}')]
+    thread.join()
+
+    # Truncation.
+    thread = write_later(path, b'{"c": 3}', 'wb')
+    assert next(docs) == [(0, b'{"c": 3}')]
+    thread.join()
+
+    # Rotation, the rest of the old file is read first.
+    os.rename(path, path + '.1')
+    with open(path + '.1', 'ab') as f:
+        f.write(b' {"d": 4}')
+    thread = write_later(path, b'{"e": 5} ', 'wb')
+    assert next(docs) == [(9, b'{"d": 4}')]
+    assert next(docs) == [(0, b'{"e": 5}')]
+    thread.join()
+    docs.close()
+
+def follow_appended(tmp_path, history, appended, **kwargs):
+    path = str(tmp_path / 'log.json')
+    with open(path, 'wb') as f:
+        f.write(history)
+    docs = stream.follow(path, **kwargs)
+    thread = write_later(path, appended)
+    spans = next(docs)
+    thread.join()
+    docs.close()
+    return spans
+
+def test_follow_from_end(tmp_path):
+    # The history is never split, so its stray "}" does no harm, and the rest
+    # of the document cut by the end of the file is dropped.
+    assert follow_appended(tmp_path,
+                           b'}\n{"a": 1}\n{"b":',
+                           b' 2}\n{"c": 3}\n') == [(20, b'{"c": 3}')]
+
+    # The end of the file was inside a document spanning several lines.
+    assert follow_appended(tmp_path,
+                           b'{"a": 1}\n{\n  "x": {\n',
+                           b'    "y": 1\n  }\n}\n{"c": 3}\n') == \
+        [(37, b'{"c": 3}')]
+
+    # With unwrap the history is split to find the elements, unless it is
+    # malformed.
+    assert follow_appended(tmp_path,
+                           b'[{"a": 1}, {"b":',
+                           b' 2}, {"c": 3},',
+                           unwrap=True) == [(11, b'{"b": 2}'), (21, b'{"c": 3}')]
+    assert follow_appended(tmp_path,
+                           b'[1]]\n',
+                           b'{"c": 3},\n',
+                           unwrap=True) == [(5, b'{"c": 3}')]
+
+    # A file which does not exist yet is read from its beginning.
+    docs = stream.follow(str(tmp_path / 'new.json'))
+    thread = write_later(str(tmp_path / 'new.json'), b'{"a": 1}\n', 'wb')
+    assert next(docs) == [(0, b'{"a": 1}')]
+    thread.join()
+    docs.close()
+
+def test_sample():
+    spans = [(offset, b'{}') for offset in range(0, 30000, 3)]
+    assert list(stream.sample(spans, 0)) == []
+    assert list(stream.sample(spans, 1)) == spans
+
+    sampled = list(stream.sample(spans, 0.1, seed=7))
+    assert 800 < len(sampled) < 1200
+    assert sampled == list(stream.sample(spans, 0.1, seed=7))
+    assert sampled != list(stream.sample(spans, 0.1, seed=8))
+    salted = list(stream.sample(spans, 0.1, seed=7, salt=b'a.json'))
+    assert sampled != salted
+    assert list(stream.sample(spans, 0.1, seed=7, salt='a.json')) == salted
+
+def test_sample_lines():
+    data = b''.join(b'{"a": [%d, "\\n"]}\n' % i for i in range(3000)) + b'\n7\n'
+    for probability in [0, 0.1, 1]:
+        expected = list(stream.sample(stream.iter_spans(io.BytesIO(data)),
+                                      probability,
+                                      seed=3,
+                                      salt='a.json'))
+        assert list(stream.sample_lines(io.BytesIO(data),
+                                        probability,
+                                        seed=3,
+                                        salt='a.json')) == expected
+    with pytest.raises(ValueError):
+        list(stream.sample_lines(io.BytesIO(b'{"a":\n 1}\n'), 1))
+
+def test_rate_limit():
+    now = [0.0]
+    def clock():
+        return now[0]
+    def items():
+        for i in range(100):
+            now[0] = i * 0.1
+            yield i
+    # A burst of 2, then 2 a second over the remaining 9.9 seconds.
+    limited = list(stream.rate_limit(items(), 2, clock))
+    assert limited[:2] == [0, 1]
+    assert len(limited) == 2 + 19
+
+def test_rate_limit_slow():
+    now = [0.0]
+    def clock():
+        return now[0]
+    def items():
+        for i in range(100):
+            now[0] = i * 0.1
+            yield i
+    # One item every 4 seconds, the first one right away.
+    assert list(stream.rate_limit(items(), 0.25, clock)) == [0, 40, 80]
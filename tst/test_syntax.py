@@ -1,4 +1,7 @@
 import jspf.compiler.syntax as syntax
+from jspf.compiler.CompilerError import CompilerError
+import concurrent.futures
+import pytest
 
 def test_pass_syntax():
     prog = r'  ^.[foo]./bar\d+/(?!./baz/).(.{7, ..., 15}|.{100, 105, 110})' +\
@@ -425,3 +428,57 @@ def test_pass_syntax():
           }
        ]
     }
+
+def test_pass_syntax_threads():
+    progs = [r'^.[a].[b]$/x/',
+             r'./foo/.*./bar/$/123.*/',
+             r'(.[a]|.{1, ..., 3})+(?!./b/)<.$>'] * 50
+    expected = [syntax.pass_syntax(prog).to_dict() for prog in progs]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        trees = list(executor.map(syntax.pass_syntax, progs))
+    assert [tree.to_dict() for tree in trees] == expected
+
+@pytest.mark.parametrize('prog', ['', '.>', '(.', '<.', '.[a', '.$$)'])
+def test_pass_syntax_error(prog):
+    with pytest.raises(CompilerError):
+        syntax.pass_syntax(prog)
+
+def test_compile_many():
+    progs = [r'^.[a].[b]$/x/',
+             r'.[a',
+             r'./foo/.*./bar/$/x/',
+             r'^.[a].[b]$/x/']
+    results = syntax.compile_many(progs)
+    assert results[0] is results[3]
+    assert isinstance(results[1], CompilerError)
+    assert results[2].to_dict() == syntax.pass_syntax(progs[2]).to_dict()
+    assert results[0].to_dict() == syntax.pass_syntax(progs[0]).to_dict()
+
+def test_compile_many_interning():
+    results = syntax.compile_many([r'.[a]./x/$', r'.[b]./x/$'])
+    # The shared suffix "./x/$" is stored once.
+    (tail_a, tail_b) = [tree.subtree[2] for tree in results]
+    assert tail_a is tail_b
+    assert results[0].subtree[0] is not results[1].subtree[0]
+
+    # Identical regex tokens in different positions are stored once.
+    [tree] = syntax.compile_many([r'./x/./x/'])
+    first = tree.subtree[0].subtree[1].subtree[0]
+    second = tree.subtree[2].subtree[0].subtree[1].subtree[0]
+    assert first is second
+
+def test_pass_syntax_union():
+    tree = syntax.pass_syntax(r'(.[a]|.[b]|.[c])')
+    u_tree = tree.subtree[0].subtree[2]
+    assert u_tree.node_type == syntax.Node.U
+    assert [st.node_type for st in u_tree.subtree[1::2]] == [syntax.Node.S] * 2
+
+def test_intern_copies():
+    tree = syntax.pass_syntax(r'.[a]./x/$')
+    before = tree.to_dict()
+    subtree = list(tree.subtree)
+    interned = syntax.Interner().intern(tree)
+    assert interned is not tree
+    assert tree.subtree == subtree
+    assert tree.subtree[0].subtree[0].subtree[0].prog_idx == 0
+    assert interned.to_dict() == before
@@ -0,0 +1,98 @@
+import jspf.writer as writer
+import errno
+import os
+import pytest
+
+def read_all(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+@pytest.fixture
+def out(tmp_path):
+    path = str(tmp_path / 'out.json')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    yield (fd, path)
+    os.close(fd)
+
+def test_batch_writer(out):
+    (fd, path) = out
+    with writer.BatchWriter(fd, flush_bytes=20) as w:
+        w.write(b'{"a": 1}')
+        assert read_all(path) == b''
+        w.write_batch([b'{"b": 2}', b'[3]'])
+        w.write(bytearray(b'4'))
+    assert read_all(path) == b'{"a": 1}\n{"b": 2}\n[3]\n4\n'
+
+def test_write_all_partial(out, monkeypatch):
+    (fd, path) = out
+    writev = os.writev
+    monkeypatch.setattr(os, 'writev', lambda fd, bufs: writev(fd, [bufs[0][:3]]))
+    writer.write_all(fd, [b'abcdefg', b'', b'hi', b'jklm'])
+    assert read_all(path) == b'abcdefghijklm'
+
+def test_write_range(out, tmp_path):
+    (fd, path) = out
+    in_path = str(tmp_path / 'in.json')
+    with open(in_path, 'wb') as f:
+        f.write(b'{"a": 1} {"b": 2} {"c": 3}')
+    in_fd = os.open(in_path, os.O_RDONLY)
+    try:
+        with writer.BatchWriter(fd) as w:
+            w.write(b'[0]')
+            w.write_range(in_fd, 9, 8)
+            w.write(b'[4]')
+        with pytest.raises(EOFError):
+            writer.copy_range(fd, in_fd, 20, 100)
+    finally:
+        os.close(in_fd)
+    assert read_all(path) == b'[0]\n{"b": 2}\n[4]\n'
+
+@pytest.fixture
+def in_fd(tmp_path):
+    in_path = str(tmp_path / 'in.json')
+    with open(in_path, 'wb') as f:
+        f.write(b'{"a": 1} {"b": 2} {"c": 3}')
+    fd = os.open(in_path, os.O_RDONLY)
+    yield fd
+    os.close(fd)
+
+def test_copy_range_append(tmp_path, in_fd):
+    path = str(tmp_path / 'out.json')
+    with open(path, 'wb') as f:
+        f.write(b'[0]\n')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+    try:
+        writer.copy_range(fd, in_fd, 9, 8)
+    finally:
+        os.close(fd)
+    assert read_all(path) == b'[0]\n{"b": 2}'
+
+def test_copy_range_errors(out, in_fd, monkeypatch):
+    (fd, path) = out
+    def fail(errno_value):
+        def copy_file_range(*args):
+            raise OSError(errno_value, os.strerror(errno_value))
+        return copy_file_range
+    monkeypatch.setattr(os, 'copy_file_range', fail(errno.EXDEV), raising=False)
+    writer.copy_range(fd, in_fd, 9, 8)
+    assert read_all(path) == b'{"b": 2}'
+
+    for errno_value in [errno.ENOSPC, errno.EBADF]:
+        monkeypatch.setattr(os, 'copy_file_range', fail(errno_value))
+        with pytest.raises(OSError) as exc_info:
+            writer.copy_range(fd, in_fd, 0, 8)
+        assert exc_info.value.errno == errno_value
+    assert read_all(path) == b'{"b": 2}'
+
+def test_ordered_merge(out):
+    (fd, path) = out
+    with writer.BatchWriter(fd) as w:
+        merge = writer.OrderedMerge(w)
+        merge.put(2, [b'5'])
+        merge.put(1, [b'3', b'4'])
+        w.flush()
+        assert read_all(path) == b''
+        merge.put(0, [b'1', b'2'])
+        merge.put(3, [])
+        merge.put(4, [b'6'])
+    assert read_all(path) == b'1\n2\n3\n4\n5\n6\n'